@@ -0,0 +1,172 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+# Limits for expensive forecast fits - override with environment variables
+MAX_CONCURRENT_FITS = int(os.getenv("FORECAST_MAX_CONCURRENT_FITS", os.cpu_count() or 2))
+MAX_QUEUE_DEPTH = int(os.getenv("FORECAST_MAX_QUEUE_DEPTH", 32))
+MAX_QUEUED_PER_TENANT = int(os.getenv("FORECAST_MAX_QUEUED_PER_TENANT", 4))
+
+
+class AdmissionController:
+    """
+    Bounds how many forecast fits run at once.
+
+    Requests beyond the concurrency limit wait in a bounded queue. Each tenant
+    has its own FIFO queue and freed slots are handed out round-robin across
+    tenants, so one tenant firing a loop of requests cannot starve the others.
+    When a tenant has too many requests waiting it gets a 429, and when the
+    whole queue is full everyone gets a 503 - both with a Retry-After header.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue_depth: int, max_queued_per_tenant: int):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue_depth = max_queue_depth
+        self.max_queued_per_tenant = max_queued_per_tenant
+
+        self.active = 0
+        self.queued = 0
+        # tenant -> deque of waiting futures; dict order is the round-robin order
+        self.waiters: "OrderedDict[int, deque]" = OrderedDict()
+
+        # Metrics
+        self.admitted_total = 0
+        self.rejected_tenant_total = 0
+        self.rejected_full_total = 0
+        self.wait_seconds_max = 0.0
+        self.recent_waits = deque(maxlen=1000)
+        self.avg_fit_seconds = 0.0
+
+    # ---------- Acquire / release ----------
+
+    async def acquire(self, tenant: int):
+        if self.active < self.max_concurrent and self.queued == 0:
+            self.active += 1
+            self._record_wait(0.0)
+            return
+
+        tenant_queue = self.waiters.get(tenant)
+        if tenant_queue is not None and len(tenant_queue) >= self.max_queued_per_tenant:
+            self.rejected_tenant_total += 1
+            raise self._reject(status.HTTP_429_TOO_MANY_REQUESTS, "Too many forecasts queued for this account")
+        if self.queued >= self.max_queue_depth:
+            self.rejected_full_total += 1
+            raise self._reject(status.HTTP_503_SERVICE_UNAVAILABLE, "Forecast queue is full, try again later")
+
+        fut = asyncio.get_running_loop().create_future()
+        if tenant_queue is None:
+            tenant_queue = self.waiters[tenant] = deque()
+        tenant_queue.append(fut)
+        self.queued += 1
+
+        started = time.monotonic()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # A slot was already handed to us - pass it on
+                self.release()
+            else:
+                self._remove_waiter(tenant, fut)
+            raise
+        self._record_wait(time.monotonic() - started)
+
+    def release(self):
+        # Hand the freed slot straight to the next tenant in round-robin order
+        while self.waiters:
+            tenant, tenant_queue = next(iter(self.waiters.items()))
+            fut = tenant_queue.popleft()
+            self.queued -= 1
+            if tenant_queue:
+                self.waiters.move_to_end(tenant)
+            else:
+                del self.waiters[tenant]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, tenant: int):
+        await self.acquire(tenant)
+        started = time.monotonic()
+        try:
+            yield
+            # Exponential moving average of completed fits, used to estimate
+            # Retry-After; failed or cancelled runs would skew it
+            elapsed = time.monotonic() - started
+            self.avg_fit_seconds = elapsed if self.avg_fit_seconds == 0 else 0.8 * self.avg_fit_seconds + 0.2 * elapsed
+        finally:
+            self.release()
+
+    # ---------- Helpers ----------
+
+    def _remove_waiter(self, tenant: int, fut):
+        tenant_queue = self.waiters.get(tenant)
+        if tenant_queue is None or fut not in tenant_queue:
+            return
+        tenant_queue.remove(fut)
+        self.queued -= 1
+        if not tenant_queue:
+            del self.waiters[tenant]
+
+    def _record_wait(self, seconds: float):
+        self.admitted_total += 1
+        self.recent_waits.append(seconds)
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def retry_after_seconds(self) -> int:
+        # Rough estimate: time for the current queue to drain through all slots
+        per_fit = self.avg_fit_seconds or 1.0
+        return max(1, math.ceil(per_fit * (self.queued + 1) / self.max_concurrent))
+
+    def estimated_completion_seconds(self) -> Optional[float]:
+        """
+        Rough time until a fit requested now would finish (queue wait plus
+        one fit), or None before any fit has been timed.
+        """
+        if self.avg_fit_seconds == 0:
+            return None
+        if self.active < self.max_concurrent and self.queued == 0:
+            return self.avg_fit_seconds
+        return self.avg_fit_seconds * (1 + (self.queued + 1) / self.max_concurrent)
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after_seconds())},
+        )
+
+    def metrics(self) -> dict:
+        waits = sorted(self.recent_waits)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        return {
+            "active_fits": self.active,
+            "max_concurrent_fits": self.max_concurrent,
+            "queue_depth": self.queued,
+            "queue_capacity": self.max_queue_depth,
+            "tenants_waiting": len(self.waiters),
+            "admitted_total": self.admitted_total,
+            "rejected_tenant_limit_total": self.rejected_tenant_total,
+            "rejected_queue_full_total": self.rejected_full_total,
+            "wait_seconds_p50": percentile(0.50),
+            "wait_seconds_p95": percentile(0.95),
+            "wait_seconds_max": self.wait_seconds_max,
+            "avg_fit_seconds": self.avg_fit_seconds,
+        }
+
+
+# Shared controller for the whole process
+admission = AdmissionController(MAX_CONCURRENT_FITS, MAX_QUEUE_DEPTH, MAX_QUEUED_PER_TENANT)
@@ -0,0 +1,302 @@
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+
+# Categories encoded as dummy regressors (extend with your categories as needed)
+SEASONALITY_CATEGORIES = ['high', 'low', 'summer', 'winter', 'spring', 'fall']
+WEATHER_CATEGORIES = ['sunny', 'rainy', 'snowy', 'cloudy']
+
+# Backends ordered from cheapest to most expensive
+BACKEND_COST_ORDER = ["seasonal_naive", "prophet"]
+
+# A cheaper backend is chosen when its backtest MAPE is within this fraction of Prophet's
+BACKEND_SELECTION_TOLERANCE = float(os.getenv("BACKEND_SELECTION_TOLERANCE", 0.05))
+
+# Prophet's default interval width, reused by the cheaper backends
+INTERVAL_WIDTH = 0.8
+
+# Recent periods averaged by the approximate weekly/monthly forecast
+APPROXIMATE_WINDOW_PERIODS = 4
+
+# Posterior samples drawn for the prediction intervals in each uncertainty mode
+UNCERTAINTY_SAMPLES = {
+    "none": 0,
+    "reduced": int(os.getenv("FORECAST_REDUCED_UNCERTAINTY_SAMPLES", 200)),
+    "full": 1000,
+}
+
+# Forecast granularities: pandas frequency, days per period and the Prophet
+# seasonality settings that make sense at that resolution
+GRANULARITIES = {
+    "daily": {"freq": "D", "period_days": 1, "seasonality": {}},
+    "weekly": {"freq": "W", "period_days": 7,
+               "seasonality": {"daily_seasonality": False, "weekly_seasonality": False}},
+    "monthly": {"freq": "MS", "period_days": 30,
+                "seasonality": {"daily_seasonality": False, "weekly_seasonality": False, "yearly_seasonality": 5}},
+}
+
+
+def is_default_scenario(simulation_params) -> bool:
+    """
+    True when the simulation inputs leave every regressor at its historical
+    default, i.e. the forecast is a plain baseline forecast.
+    """
+    if simulation_params is None:
+        return True
+    if simulation_params.discount_pct not in (None, 0, 0.0):
+        return False
+    if simulation_params.is_holiday not in (None, 0):
+        return False
+    if simulation_params.seasonality and simulation_params.seasonality.lower() in SEASONALITY_CATEGORIES:
+        return False
+    if simulation_params.weather_condition and simulation_params.weather_condition.lower() in WEATHER_CATEGORIES:
+        return False
+    return True
+
+
+def scenario_key(simulation_params) -> str:
+    """
+    Storage key for a scenario: "default" for baseline forecasts, otherwise a
+    stable JSON encoding of the normalised simulation inputs.
+    """
+    if is_default_scenario(simulation_params):
+        return "default"
+    return json.dumps({
+        "discount_pct": float(simulation_params.discount_pct or 0.0),
+        "is_holiday": int(simulation_params.is_holiday or 0),
+        "seasonality": (simulation_params.seasonality or "").lower(),
+        "weather_condition": (simulation_params.weather_condition or "").lower(),
+    }, sort_keys=True)
+
+
+def choose_backend(accuracy_rows) -> str:
+    """
+    Picks the cheapest backend whose stored backtest MAPE is as good as
+    Prophet's (within the tolerance). Defaults to Prophet without scores.
+    """
+    scores = {row["backend"]: row["mape"] for row in accuracy_rows if row["mape"] is not None}
+    if "prophet" not in scores:
+        return "prophet"
+    for name in BACKEND_COST_ORDER:
+        if name in scores and scores[name] <= scores["prophet"] * (1 + BACKEND_SELECTION_TOLERANCE):
+            return name
+    return "prophet"
+
+
+def quantile_column(q: float) -> str:
+    return f"yhat_q{q:g}"
+
+
+def drop_intervals(records):
+    """Strips interval and quantile columns, e.g. from a stored full forecast."""
+    return [{k: v for k, v in record.items() if k == "ds" or k == "yhat"} for record in records]
+
+
+def _interval_levels(uncertainty: str, quantiles=None) -> dict:
+    # Output column -> quantile of the predictive distribution
+    if uncertainty == "none":
+        return {}
+    alpha = (1 - INTERVAL_WIDTH) / 2
+    levels = {"yhat_lower": alpha, "yhat_upper": 1 - alpha}
+    for q in quantiles or []:
+        levels[quantile_column(q)] = q
+    return levels
+
+
+def resample_sales(df: pd.DataFrame, granularity: str) -> pd.DataFrame:
+    """
+    Aggregates the raw sales rows into weekly or monthly totals. Rows that
+    share a date are averaged first, as the daily models do, so a period
+    total is the sum of its daily values. Partial periods at either end are
+    dropped so they don't look like a dip. Daily data is returned unchanged.
+    """
+    if granularity == "daily":
+        return df
+
+    sales = df.assign(date=pd.to_datetime(df["date"])).groupby("date")["sales"].mean()
+    totals = sales.resample(GRANULARITIES[granularity]["freq"]).sum()
+
+    # Period bounds for each label ("W" labels the week end, "MS" the month start)
+    if granularity == "weekly":
+        starts, ends = totals.index - pd.Timedelta(days=6), totals.index
+    else:
+        starts, ends = totals.index, totals.index + pd.offsets.MonthEnd(0)
+    complete = (starts >= sales.index.min()) & (ends <= sales.index.max())
+    return totals[complete].rename("sales").rename_axis("date").reset_index()
+
+
+def prophet_forecast(
+    df: pd.DataFrame,
+    days: int,
+    simulation_params=None,
+    granularity: str = "daily",
+    uncertainty: str = "full",
+    quantiles=None,
+):
+    """
+    Fits Prophet on the historical sales frame and returns the forecast records
+    for the requested days, one per period of the given granularity (the
+    frame must already be resampled). The uncertainty mode sets how many
+    posterior samples back yhat_lower/yhat_upper ("none" skips them); extra
+    quantile levels come from the same samples. CPU-bound - call it off the
+    event loop.
+    """
+    settings = GRANULARITIES[granularity]
+    periods = max(1, math.ceil(days / settings["period_days"]))
+
+    df = df.rename(columns={"date": "ds", "sales": "y"})
+    df['ds'] = pd.to_datetime(df['ds'])
+
+    # Prepare columns for new regressors with default historical values (assumed 0 or base level)
+    # Extend as needed for actual historical regressor data if available
+
+    # Discount - default 0 (no discount historically)
+    df['discount_pct'] = 0.0
+    # Holiday - default 0 (no holiday historically)
+    df['is_holiday'] = 0
+
+    # Seasonality and Weather are categorical, encode with dummy variables
+    for cat in SEASONALITY_CATEGORIES:
+        col_name = f"seasonality_{cat}"
+        df[col_name] = 0
+
+    for cat in WEATHER_CATEGORIES:
+        col_name = f"weather_{cat}"
+        df[col_name] = 0
+
+    # Initialize Prophet model and add all regressors
+    m = Prophet(interval_width=INTERVAL_WIDTH, uncertainty_samples=UNCERTAINTY_SAMPLES[uncertainty],
+                **settings["seasonality"])
+    m.add_regressor('discount_pct')
+    m.add_regressor('is_holiday')
+    for cat in SEASONALITY_CATEGORIES:
+        m.add_regressor(f"seasonality_{cat}")
+    for cat in WEATHER_CATEGORIES:
+        m.add_regressor(f"weather_{cat}")
+
+    # Fit the model with historical data
+    m.fit(df)
+
+    # Create a future dataframe for the forecast period only - predicting the
+    # history as well would only be thrown away
+    future = m.make_future_dataframe(periods=periods, freq=settings["freq"], include_history=False)
+
+    discount_pct = getattr(simulation_params, "discount_pct", None)
+    is_holiday = getattr(simulation_params, "is_holiday", None)
+    seasonality = getattr(simulation_params, "seasonality", None)
+    weather_condition = getattr(simulation_params, "weather_condition", None)
+
+    # Populate the regressor columns in future dataframe with simulation inputs
+    future['discount_pct'] = discount_pct if discount_pct is not None else 0.0
+    future['is_holiday'] = is_holiday if is_holiday is not None else 0
+
+    # Set all seasonality and weather dummy columns to 0 initially
+    for cat in SEASONALITY_CATEGORIES:
+        future[f"seasonality_{cat}"] = 0
+    for cat in WEATHER_CATEGORIES:
+        future[f"weather_{cat}"] = 0
+
+    # Mark the selected seasonality and weather category as 1 if provided and valid
+    if seasonality and seasonality.lower() in SEASONALITY_CATEGORIES:
+        future[f"seasonality_{seasonality.lower()}"] = 1
+
+    if weather_condition and weather_condition.lower() in WEATHER_CATEGORIES:
+        future[f"weather_{weather_condition.lower()}"] = 1
+
+    # Point forecast without predict()'s own interval sampling; the intervals
+    # and any extra quantiles are taken from one set of posterior samples
+    samples = m.uncertainty_samples
+    m.uncertainty_samples = 0
+    forecast_df = m.predict(future)[['ds', 'yhat']]
+    levels = _interval_levels(uncertainty, quantiles)
+    if levels:
+        m.uncertainty_samples = samples
+        draws = m.predictive_samples(future)["yhat"]
+        values = np.nanquantile(draws, list(levels.values()), axis=1)
+        for column, row in zip(levels, values):
+            forecast_df[column] = row
+
+    return forecast_df.to_dict(orient='records')
+
+
+def seasonal_naive_forecast(
+    df: pd.DataFrame,
+    days: int,
+    simulation_params=None,
+    season_length: int = 7,
+    seasons: int = 4,
+    uncertainty: str = "full",
+    quantiles=None,
+):
+    """
+    Cheap baseline: each future day is the average of the same weekday over the
+    last few weeks. Intervals come from the empirical spread of the in-sample
+    errors. Ignores simulation inputs, so only use it for default scenarios.
+    """
+    daily = (
+        df.assign(ds=pd.to_datetime(df["date"]))
+        .groupby("ds")["sales"].mean()
+        .asfreq("D")
+        .interpolate(limit_direction="both")
+    )
+    y = daily.to_numpy(dtype=float)
+    window = min(len(y), season_length * seasons)
+    window -= window % season_length
+    if window < season_length:
+        # Too little history for a weekly profile - fall back to the mean
+        profile = np.full(season_length, y.mean())
+    else:
+        profile = y[-window:].reshape(-1, season_length).mean(axis=0)
+
+    # The window is whole weeks ending on the last observed day, so the profile
+    # already starts on the weekday of the first future day
+    yhat = np.resize(profile, days)
+    ds = pd.date_range(daily.index[-1] + pd.Timedelta(days=1), periods=days, freq="D")
+    result = pd.DataFrame({"ds": ds, "yhat": yhat})
+
+    # Residuals of the same rule applied to history give the interval width
+    residuals = y[season_length:] - y[:-season_length] if len(y) > season_length else np.zeros(1)
+    _add_empirical_intervals(result, residuals, uncertainty, quantiles)
+    return result.to_dict(orient='records')
+
+
+def _add_empirical_intervals(result: pd.DataFrame, residuals, uncertainty: str, quantiles=None):
+    levels = _interval_levels(uncertainty, quantiles)
+    if not levels:
+        return
+    offsets = np.quantile(residuals, list(levels.values()))
+    for column, offset in zip(levels, offsets):
+        result[column] = result["yhat"] + offset
+
+
+def approximate_forecast(df: pd.DataFrame, days: int, granularity: str = "daily", uncertainty: str = "full", quantiles=None):
+    """
+    Fast stand-in for a Prophet fit when there is no time for one. Daily
+    series use the seasonal-naive backend; weekly and monthly totals are
+    forecast as the mean of the last few periods, with intervals from the
+    spread of period-to-period changes. Ignores simulation inputs.
+    """
+    if granularity == "daily":
+        return seasonal_naive_forecast(df, days, uncertainty=uncertainty, quantiles=quantiles)
+
+    settings = GRANULARITIES[granularity]
+    periods = max(1, math.ceil(days / settings["period_days"]))
+    y = df["sales"].to_numpy(dtype=float)
+    level = y[-APPROXIMATE_WINDOW_PERIODS:].mean()
+
+    # Same period labels as Prophet's make_future_dataframe
+    last = pd.to_datetime(df["date"]).iloc[-1]
+    ds = pd.date_range(last, periods=periods + 1, freq=settings["freq"])[1:]
+    result = pd.DataFrame({"ds": ds, "yhat": level})
+    _add_empirical_intervals(result, np.diff(y) if len(y) > 1 else np.zeros(1), uncertainty, quantiles)
+    return result.to_dict(orient='records')
+
+
+BACKENDS = {
+    "prophet": prophet_forecast,
+    "seasonal_naive": seasonal_naive_forecast,
+}
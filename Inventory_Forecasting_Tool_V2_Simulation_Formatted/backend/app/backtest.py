@@ -0,0 +1,183 @@
+import asyncio
+import json
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from .admission import admission
+from .auth import oauth2_scheme, decode_access_token
+from .backends import BACKENDS
+from .crud import get_all_sales_data, save_forecast_accuracy
+from .workers import backtest_pool
+
+router = APIRouter()
+
+
+def rolling_cutoffs(dates: pd.Series, horizon: int, initial_days: int, period_days: int, max_folds: int):
+    """
+    Rolling-origin cutoffs for one series: the first leaves initial_days of
+    training history, each next one moves period_days forward, and every
+    cutoff leaves a full horizon of actuals after it. Keeps the most recent
+    max_folds cutoffs.
+    """
+    first = dates.min() + pd.Timedelta(days=initial_days)
+    last = dates.max() - pd.Timedelta(days=horizon)
+    cutoffs = []
+    cutoff = last
+    while cutoff >= first and len(cutoffs) < max_folds:
+        cutoffs.append(cutoff)
+        cutoff -= pd.Timedelta(days=period_days)
+    return sorted(cutoffs)
+
+
+def evaluate_fold(backend: str, train: pd.DataFrame, actual: pd.DataFrame, horizon: int) -> dict:
+    """
+    Forecasts horizon days from the training rows and scores them against
+    the daily actuals. Runs inside a worker process.
+    """
+    # Only yhat is scored, so skip the prediction intervals
+    predicted = pd.DataFrame(BACKENDS[backend](train, horizon, uncertainty="none"))[["ds", "yhat"]]
+    merged = actual.merge(predicted, on="ds")
+    if merged.empty:
+        return {"mape": None, "rmse": None, "points": 0}
+
+    y = merged["y"].to_numpy(dtype=float)
+    err = y - merged["yhat"].to_numpy(dtype=float)
+    nonzero = y != 0
+    mape = float(np.mean(np.abs(err[nonzero] / y[nonzero])) * 100) if nonzero.any() else None
+    rmse = float(np.sqrt(np.mean(err ** 2)))
+    return {"mape": mape, "rmse": rmse, "points": int(len(merged))}
+
+
+def _release_slot(fit):
+    admission.release()
+    # Retrieve the outcome of an abandoned fold so it isn't logged as unhandled
+    if not fit.cancelled():
+        fit.exception()
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return float(sum(values) / len(values)) if values else None
+
+
+@router.post("/backtest/")
+async def backtest(
+    horizon: int = 30,
+    initial_days: int = 365,
+    period_days: int = 90,
+    max_folds: int = 3,
+    product: Optional[str] = None,
+    city: Optional[str] = None,
+    backends: List[str] = Query(default=["prophet", "seasonal_naive"]),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Runs a rolling-origin backtest over every series (or the selected one)
+    and streams progress as newline-delimited JSON. Per-series MAPE/RMSE for
+    each backend are stored so /forecast/ can pick a cheaper backend when it
+    scores as well as Prophet.
+    """
+    token_data = decode_access_token(token)
+    user_id = int(token_data["user_id"])
+
+    unknown = [name for name in backends if name not in BACKENDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown backends: {unknown}")
+
+    all_rows = await get_all_sales_data(user_id, product or None, city or None)
+    if not all_rows:
+        raise HTTPException(status_code=404, detail="No sales data found.")
+
+    df = pd.DataFrame([dict(row) for row in all_rows])[["product", "city", "date", "sales"]]
+    df["date"] = pd.to_datetime(df["date"])
+
+    # One task per series x backend x cutoff
+    tasks = []
+    for (series_product, series_city), series in df.groupby(["product", "city"]):
+        daily = series.groupby("date")["sales"].mean().rename("y").reset_index().rename(columns={"date": "ds"})
+        for cutoff in rolling_cutoffs(series["date"], horizon, initial_days, period_days, max_folds):
+            train = series[series["date"] <= cutoff][["date", "sales"]]
+            window_end = cutoff + pd.Timedelta(days=horizon)
+            actual = daily[(daily["ds"] > cutoff) & (daily["ds"] <= window_end)]
+            for backend in backends:
+                tasks.append(((series_product, series_city), backend, cutoff, train, actual))
+
+    if not tasks:
+        raise HTTPException(status_code=400, detail="Not enough history for the requested horizon and initial window")
+
+    # Every fold takes its own admission slot, so a backtest never runs more
+    # fits than the global limit allows. At most this many folds wait or run
+    # at once, which keeps the tenant within its queue limit.
+    parallel = asyncio.Semaphore(max(1, min(backtest_pool.workers, admission.max_queued_per_tenant)))
+
+    async def run_task(key, backend, cutoff, train, actual):
+        async with parallel:
+            while True:
+                try:
+                    await admission.acquire(user_id)
+                    break
+                except HTTPException as exc:
+                    # Forecast queue is busy - back off instead of failing the fold
+                    await asyncio.sleep(int(exc.headers["Retry-After"]))
+            fit = asyncio.ensure_future(backtest_pool.run(evaluate_fold, backend, train, actual, horizon))
+            # The worker keeps running a fold abandoned by a disconnected
+            # client, so its slot goes back only once the fold really finishes
+            fit.add_done_callback(_release_slot)
+            try:
+                score = await asyncio.shield(fit)
+                error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                score, error = {"mape": None, "rmse": None, "points": 0}, str(exc)
+        return key, backend, cutoff, score, error
+
+    async def stream():
+        pending = [asyncio.ensure_future(run_task(*task)) for task in tasks]
+        scores = {}
+        try:
+            for completed, next_done in enumerate(asyncio.as_completed(pending), start=1):
+                key, backend, cutoff, score, error = await next_done
+                scores.setdefault(key, {}).setdefault(backend, []).append(score)
+                event = {
+                    "type": "progress",
+                    "completed": completed,
+                    "total": len(tasks),
+                    "product": key[0],
+                    "city": key[1],
+                    "backend": backend,
+                    "cutoff": cutoff.date().isoformat(),
+                    **score,
+                }
+                if error:
+                    event["error"] = error
+                yield json.dumps(event) + "\n"
+
+            for (series_product, series_city), by_backend in scores.items():
+                summary = []
+                for backend, folds in by_backend.items():
+                    summary.append({
+                        "backend": backend,
+                        "mape": _mean(f["mape"] for f in folds),
+                        "rmse": _mean(f["rmse"] for f in folds),
+                        "folds": sum(1 for f in folds if f["points"]),
+                        "horizon": horizon,
+                    })
+                await save_forecast_accuracy(user_id, series_product, series_city, summary)
+                yield json.dumps({
+                    "type": "series",
+                    "product": series_product,
+                    "city": series_city,
+                    "scores": summary,
+                }) + "\n"
+
+            yield json.dumps({"type": "done", "series": len(scores), "folds": len(tasks)}) + "\n"
+        finally:
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,9 +1,13 @@
-from .models import users, sales_data
+from .models import users, sales_data, forecast_accuracy, forecasts
 from .schemas import UserCreate
 from .auth import get_password_hash
-from .database import database
-from sqlalchemy import and_, select, distinct
+from .database import database, IS_SQLITE
+from .partitions import SALES_COLUMNS, swap_user_partition
+from sqlalchemy import and_, select, distinct, func, tuple_
 from typing import Optional, List
+import json
+import math
+from datetime import date, datetime
 
 
 async def get_user_by_email(email: str):
@@ -11,15 +15,21 @@ async def get_user_by_email(email: str):
     return await database.fetch_one(query)
 
 
+async def get_user_by_id(user_id: int):
+    query = users.select().where(users.c.id == user_id)
+    return await database.fetch_one(query)
+
+
 async def create_user(user: UserCreate):
+    # Self-registered users are always managers; admins are promoted in the database
     hashed_password = get_password_hash(user.password)
     query = users.insert().values(
         email=user.email,
         hashed_password=hashed_password,
-        role=user.role
+        role="manager"
     )
     user_id = await database.execute(query)
-    return {"id": user_id, "email": user.email, "role": user.role}
+    return {"id": user_id, "email": user.email, "role": "manager"}
 
 
 async def authenticate_user(email: str, password: str):
@@ -32,50 +42,140 @@ async def authenticate_user(email: str, password: str):
     return user
 
 
-async def add_sales_data(data_rows: List[dict], user_id: int):
-    # Allowed columns for the sales_data table — update if you add more to models.py
-    allowed_columns = {
-        "product",
-        "city",
-        "date",
-        "sales",
-        "user_id",
-        "discount_pct",
-        "seasonality",
-        "is_holiday",
-        "weather_condition",
-    }
-    query = sales_data.insert()
-    for row in data_rows:
-        # Always set 'user_id'
-        row_to_insert = {k: v for k, v in row.items() if k in allowed_columns}
-        row_to_insert["user_id"] = user_id
-        await database.execute(query.values(**row_to_insert))
-
-
-async def get_sales_data(product: str, city: str, user_id: int):
-    query = sales_data.select().where(
+def _clean_sales_row(row: dict, user_id: int) -> dict:
+    # Keep only sales_data columns, turn pandas NaN into NULL and coerce types
+    # so the rows can be bulk-copied straight into PostgreSQL
+    cleaned = {}
+    for col in SALES_COLUMNS:
+        value = row.get(col)
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        cleaned[col] = value
+    cleaned["user_id"] = user_id
+    cleaned["sales"] = float(cleaned["sales"])
+    cleaned["product"] = str(cleaned["product"])
+    cleaned["city"] = str(cleaned["city"])
+    if cleaned["discount_pct"] is not None:
+        cleaned["discount_pct"] = float(cleaned["discount_pct"])
+    if cleaned["is_holiday"] is not None:
+        cleaned["is_holiday"] = int(cleaned["is_holiday"])
+    for col in ("seasonality", "weather_condition"):
+        if cleaned[col] is not None:
+            cleaned[col] = str(cleaned[col])
+    return cleaned
+
+
+async def replace_sales_data(data_rows: List[dict], user_id: int):
+    """
+    Replaces all of a user's sales data with data_rows in one atomic swap.
+    """
+    rows = [_clean_sales_row(row, user_id) for row in data_rows]
+    if not IS_SQLITE:
+        await swap_user_partition(user_id, rows)
+        return
+
+    # SQLite has no partitions: delete and bulk insert in one transaction.
+    # Under WAL, readers keep seeing the old rows until the commit.
+    columns = ", ".join(SALES_COLUMNS)
+    placeholders = ", ".join("?" for _ in SALES_COLUMNS)
+    insert_sql = f"INSERT INTO sales_data ({columns}) VALUES ({placeholders})"
+    params = [
+        tuple(row[col].isoformat() if col == "date" else row[col] for col in SALES_COLUMNS)
+        for row in rows
+    ]
+    async with database.transaction():
+        await database.execute(sales_data.delete().where(sales_data.c.user_id == user_id))
+        async with database.connection() as connection:
+            await connection.raw_connection.executemany(insert_sql, params)
+
+
+async def get_sales_data(product: str, city: str, user_id: int, since: Optional[date] = None):
+    conditions = [
+        sales_data.c.product == product,
+        sales_data.c.city == city,
+        sales_data.c.user_id == user_id
+    ]
+    if since is not None:
+        # Only pull the history window that will actually be fitted
+        conditions.append(sales_data.c.date >= since)
+    query = sales_data.select().where(and_(*conditions))
+    return await database.fetch_all(query)
+
+
+async def get_latest_sales_date(product: str, city: str, user_id: int):
+    query = select(func.max(sales_data.c.date)).where(
         and_(
             sales_data.c.product == product,
             sales_data.c.city == city,
             sales_data.c.user_id == user_id
         )
     )
-    return await database.fetch_all(query)
+    return await database.fetch_val(query)
 
 
 # ------------------------
 # New and improved methods
 # ------------------------
 
-async def get_all_sales_data(user_id: int):
+async def get_all_sales_data(user_id: int, product: Optional[str] = None, city: Optional[str] = None):
     """
-    Return all sales data rows for a given user.
+    Return all sales data rows for a given user, optionally only those of
+    one product and/or city.
     """
-    query = sales_data.select().where(sales_data.c.user_id == user_id)
+    conditions = [sales_data.c.user_id == user_id]
+    if product is not None:
+        conditions.append(sales_data.c.product == product)
+    if city is not None:
+        conditions.append(sales_data.c.city == city)
+    query = sales_data.select().where(and_(*conditions))
     return await database.fetch_all(query)
 
 
+async def get_series(user_id: int):
+    """
+    Returns the distinct (product, city) pairs uploaded by the user.
+    """
+    query = select(sales_data.c.product, sales_data.c.city).where(sales_data.c.user_id == user_id).distinct()
+    rows = await database.fetch_all(query)
+    return [(row[0], row[1]) for row in rows]
+
+
+async def get_users_with_sales():
+    rows = await database.fetch_all(select(distinct(sales_data.c.user_id)))
+    return [row[0] for row in rows]
+
+
+def sales_browse_query(user_id: int, filters: dict, after: Optional[tuple] = None, limit: Optional[int] = None):
+    """
+    Keyset-paginated query over a user's sales rows, ordered by
+    (product, city, date, id). `after` is the last key of the previous page;
+    `filters` maps column names to exact values, plus optional
+    date_from/date_to and min_discount/max_discount bounds.
+    """
+    columns = [c for c in sales_data.columns if c.name != "user_id"]
+    conditions = [sales_data.c.user_id == user_id]
+    for col in ("product", "city", "seasonality", "weather_condition", "is_holiday"):
+        if filters.get(col) is not None:
+            conditions.append(sales_data.c[col] == filters[col])
+    if filters.get("date_from") is not None:
+        conditions.append(sales_data.c.date >= filters["date_from"])
+    if filters.get("date_to") is not None:
+        conditions.append(sales_data.c.date <= filters["date_to"])
+    if filters.get("min_discount") is not None:
+        conditions.append(sales_data.c.discount_pct >= filters["min_discount"])
+    if filters.get("max_discount") is not None:
+        conditions.append(sales_data.c.discount_pct <= filters["max_discount"])
+
+    key = (sales_data.c.product, sales_data.c.city, sales_data.c.date, sales_data.c.id)
+    if after is not None:
+        conditions.append(tuple_(*key) > tuple_(*after))
+
+    query = select(*columns).where(and_(*conditions)).order_by(*key)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
 async def get_unique_products(user_id: int):
     query = select(distinct(sales_data.c.product)).where(sales_data.c.user_id == user_id)
     rows = await database.fetch_all(query)
@@ -104,3 +204,102 @@ async def get_unique_field_values(user_id: int, fieldname: str):
     # Return cleaned-up list, removing None values
     return sorted([row[0] for row in rows if row[0] is not None])
 
+
+# ------------------------
+# Backtest accuracy
+# ------------------------
+
+async def save_forecast_accuracy(user_id: int, product: str, city: str, scores: List[dict]):
+    """
+    Replaces the stored accuracy for one series. Each score dict holds
+    backend, mape, rmse, folds and horizon.
+    """
+    now = datetime.utcnow()
+    async with database.transaction():
+        await database.execute(forecast_accuracy.delete().where(
+            and_(
+                forecast_accuracy.c.user_id == user_id,
+                forecast_accuracy.c.product == product,
+                forecast_accuracy.c.city == city,
+            )
+        ))
+        for score in scores:
+            await database.execute(forecast_accuracy.insert().values(
+                user_id=user_id,
+                product=product,
+                city=city,
+                evaluated_at=now,
+                **score
+            ))
+
+
+async def get_forecast_accuracy(user_id: int, product: str, city: str):
+    query = forecast_accuracy.select().where(
+        and_(
+            forecast_accuracy.c.user_id == user_id,
+            forecast_accuracy.c.product == product,
+            forecast_accuracy.c.city == city,
+        )
+    )
+    return await database.fetch_all(query)
+
+
+# ------------------------
+# Stored forecasts
+# ------------------------
+
+async def save_forecast(user_id: int, product: str, city: str, scenario_key: str, backend: str, records: List[dict]):
+    """
+    Stores (or replaces) the forecast for one series and scenario.
+    """
+    payload = json.dumps([
+        {**record, "ds": record["ds"].isoformat() if hasattr(record["ds"], "isoformat") else record["ds"]}
+        for record in records
+    ])
+    where = and_(
+        forecasts.c.user_id == user_id,
+        forecasts.c.product == product,
+        forecasts.c.city == city,
+        forecasts.c.scenario_key == scenario_key,
+    )
+    async with database.transaction():
+        await database.execute(forecasts.delete().where(where))
+        await database.execute(forecasts.insert().values(
+            user_id=user_id,
+            product=product,
+            city=city,
+            scenario_key=scenario_key,
+            days=len(records),
+            backend=backend,
+            payload=payload,
+            computed_at=datetime.utcnow(),
+        ))
+
+
+async def get_stored_forecast(user_id: int, product: str, city: str, scenario_key: str):
+    query = forecasts.select().where(
+        and_(
+            forecasts.c.user_id == user_id,
+            forecasts.c.product == product,
+            forecasts.c.city == city,
+            forecasts.c.scenario_key == scenario_key,
+        )
+    )
+    return await database.fetch_one(query)
+
+
+async def get_stored_forecasts(user_id: int, scenario_key: str = "default"):
+    """
+    Returns every stored forecast of one scenario for the user.
+    """
+    query = forecasts.select().where(
+        and_(
+            forecasts.c.user_id == user_id,
+            forecasts.c.scenario_key == scenario_key,
+        )
+    )
+    return await database.fetch_all(query)
+
+
+async def delete_stored_forecasts(user_id: int):
+    await database.execute(forecasts.delete().where(forecasts.c.user_id == user_id))
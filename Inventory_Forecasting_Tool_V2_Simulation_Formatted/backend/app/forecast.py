@@ -1,13 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import pandas as pd
-from prophet import Prophet
-from .crud import get_sales_data
+from .crud import get_sales_data, get_latest_sales_date, get_forecast_accuracy, get_stored_forecast, save_forecast
 from .auth import oauth2_scheme, decode_access_token
+from .admission import admission
+from .workers import forecast_pool, WorkerMemoryError
+from .backends import (
+    BACKENDS, GRANULARITIES, UNCERTAINTY_SAMPLES, approximate_forecast, choose_backend, drop_intervals,
+    is_default_scenario, prophet_forecast, resample_sales, scenario_key,
+)
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime, timedelta
+import json
+import os
 
 router = APIRouter()
 
+# Stored forecasts older than this are recomputed live
+FORECAST_MAX_AGE_SECONDS = int(os.getenv("FORECAST_MAX_AGE_SECONDS", 24 * 3600))
+# Part of a latency budget kept back for the approximate fallback
+APPROXIMATE_RESERVE_MS = int(os.getenv("FORECAST_APPROXIMATE_RESERVE_MS", 50))
+
+# In-flight full fits whose result is stored when they finish, keyed by
+# (user_id, product, city, scenario key, days)
+_refinements = {}
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     token_data = decode_access_token(token)
     return token_data
@@ -23,82 +42,321 @@ async def forecast(
     product: str,
     city: str,
     days: int = 30,
+    granularity: str = "daily",                  # "daily", "weekly" or "monthly"
+    history_days: Optional[int] = None,          # Only fit the most recent N days of history
+    budget_ms: Optional[int] = None,             # Latency budget; degrade to faster tiers to meet it
+    background_refine: bool = False,             # With a budget: finish the full fit in the background
+    uncertainty: str = "full",                   # "none", "reduced" or "full" prediction intervals
+    quantiles: Optional[List[float]] = Query(None),  # Extra quantile levels, e.g. 0.05 and 0.95
     simulation_params: SimulationParams = Body(...),
     token: str = Depends(oauth2_scheme)
 ):
+    """
+    Without a budget the forecast is served from storage when fresh and
+    otherwise fitted live. With budget_ms the best answer available in time
+    is returned, marked by "tier": a stored result of any age ("stored"),
+    the full model if its estimated fit time fits the budget ("full"), or
+    the fast approximate model ("approximate"). The approximate model
+    ignores the simulation parameters, so its results carry
+    "scenario_applied": false for any non-default scenario.
+
+    uncertainty="none" returns yhat only and skips interval sampling,
+    "reduced" draws fewer posterior samples. Each quantile q adds a
+    yhat_q<q> column.
+    """
     token_data = decode_access_token(token)
     user_id = int(token_data["user_id"])
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {list(GRANULARITIES)}")
+    if history_days is not None and history_days < 1:
+        raise HTTPException(status_code=400, detail="history_days must be at least 1")
+    if budget_ms is not None and budget_ms <= 0:
+        raise HTTPException(status_code=400, detail="budget_ms must be positive")
+    if uncertainty not in UNCERTAINTY_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"uncertainty must be one of {list(UNCERTAINTY_SAMPLES)}")
+    if quantiles and (uncertainty == "none" or not all(0 < q < 1 for q in quantiles)):
+        raise HTTPException(status_code=400, detail="quantiles must be between 0 and 1 and need uncertainty sampling")
+    key = scenario_key(simulation_params)
 
-    sales_rows = await get_sales_data(product, city, user_id)
-    if not sales_rows:
-        raise HTTPException(status_code=404, detail="No sales data found for product/city.")
+    # Only full-history daily forecasts are precomputed and stored (with full
+    # intervals, which also serve the cheaper uncertainty modes)
+    storable = granularity == "daily" and history_days is None and not quantiles
 
-    rows = [dict(row) for row in sales_rows]
+    # Serve a precomputed result when it is fresh and covers the horizon;
+    # under a latency budget a stale one still beats an approximation
+    stored = await get_stored_forecast(user_id, product, city, key) if storable else None
+    fresh = is_fresh(stored, days)
+    if fresh or (budget_ms is not None and stored is not None and stored["days"] >= days):
+        refining = not fresh and background_refine
+        if refining:
+            start_refinement(user_id, product, city, key, days, simulation_params)
+        records = json.loads(stored["payload"])[:days]
+        return {
+            "forecast": drop_intervals(records) if uncertainty == "none" else records,
+            "backend": stored["backend"],
+            "granularity": granularity,
+            "source": "stored",
+            "tier": "stored",
+            "scenario_applied": True,
+            "refining": refining,
+            "computed_at": stored["computed_at"].isoformat(),
+        }
 
-    df = pd.DataFrame(rows or [])
-    if df.empty or 'date' not in df.columns or 'sales' not in df.columns:
-        raise HTTPException(status_code=400, detail="Sales data missing or invalid for the selection")
+    if budget_ms is not None:
+        return await forecast_within_budget(
+            user_id, product, city, days, simulation_params, granularity, history_days,
+            budget_ms, background_refine and storable, uncertainty, quantiles,
+        )
+
+    generation = data_generation(user_id)
+    result, backend = await compute_forecast(
+        user_id, product, city, days, simulation_params, granularity=granularity, history_days=history_days,
+        uncertainty=uncertainty, quantiles=quantiles,
+    )
+    computed_at = datetime.utcnow()
+    if storable and key == "default" and uncertainty == "full" and can_store(user_id, days, stored, generation):
+        await save_forecast(user_id, product, city, key, backend, result)
+
+    return {
+        "forecast": result,
+        "backend": backend,
+        "granularity": granularity,
+        "source": "live",
+        "tier": "full",
+        "scenario_applied": True,
+        "computed_at": computed_at.isoformat(),
+    }
+
+
+def is_fresh(stored, days: int) -> bool:
+    if stored is None or stored["days"] < days:
+        return False
+    return stored["computed_at"] >= datetime.utcnow() - timedelta(seconds=FORECAST_MAX_AGE_SECONDS)
+
+
+def data_generation(user_id: int) -> int:
+    # Bumped on every upload (see PrecomputeScheduler.invalidate_user)
+    from .precompute import scheduler
+    return scheduler.generations.get(user_id, 0)
+
+
+def can_store(user_id: int, days: int, stored, generation: int) -> bool:
+    """
+    True when a live result may replace the stored forecast: the user's data
+    hasn't been replaced since the fit started, and the horizon covers both
+    the standard precomputed one and the stored one, so a short request
+    never truncates it.
+    """
+    from .precompute import DEFAULT_HORIZON_DAYS
+    if data_generation(user_id) != generation:
+        return False
+    return days >= max(DEFAULT_HORIZON_DAYS, stored["days"] if stored else 0)
+
+
+async def forecast_within_budget(
+    user_id: int,
+    product: str,
+    city: str,
+    days: int,
+    simulation_params,
+    granularity: str,
+    history_days: Optional[int],
+    budget_ms: int,
+    refine: bool,
+    uncertainty: str = "full",
+    quantiles=None,
+):
+    """
+    Tries the full model when the admission controller expects it to finish
+    within the budget, and falls back to the approximate model otherwise.
+    A full fit that runs out of time is shielded rather than cancelled when
+    refine is set, so it completes in the background and its result is
+    stored for the next request.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget_ms / 1000
+    key = scenario_key(simulation_params)
+
+    daily = await load_sales_frame(user_id, product, city, history_days)
+    remaining = deadline - loop.time() - APPROXIMATE_RESERVE_MS / 1000
+    estimate = admission.estimated_completion_seconds()
+
+    fit = None
+    if remaining > 0 and (estimate is None or estimate <= remaining):
+        if refine:
+            fit = start_refinement(user_id, product, city, key, days, simulation_params, daily)
+        else:
+            fit = asyncio.ensure_future(fit_forecast(
+                user_id, product, city, daily, days, simulation_params, granularity, uncertainty, quantiles
+            ))
+        try:
+            result, backend = await asyncio.wait_for(asyncio.shield(fit), timeout=remaining)
+            # A joined refinement has full intervals
+            if uncertainty == "none":
+                result = drop_intervals(result)
+            return {
+                "forecast": result[:days],
+                "backend": backend,
+                "granularity": granularity,
+                "source": "live",
+                "tier": "full",
+                "scenario_applied": True,
+                "refining": False,
+                "computed_at": datetime.utcnow().isoformat(),
+            }
+        except asyncio.TimeoutError:
+            # Don't cancel: the fit keeps its worker and admission slot until
+            # it really finishes, so the limits and fit-time estimate stay true
+            if not refine:
+                fit.add_done_callback(_discard_result)
+        except HTTPException as exc:
+            # Fit queue is full - the approximation is still an answer
+            if exc.status_code not in (429, 503):
+                raise
+            fit = None
+    elif refine:
+        fit = start_refinement(user_id, product, city, key, days, simulation_params, daily)
 
-    df = df.rename(columns={"date": "ds", "sales": "y"})
-    df['ds'] = pd.to_datetime(df['ds'])
+    df = resample_sales(daily, granularity)
+    if len(df) < 2:
+        raise HTTPException(status_code=400, detail=f"Not enough history for a {granularity} forecast")
+    result = await run_in_threadpool(approximate_forecast, df, days, granularity, uncertainty, quantiles)
+    return {
+        "forecast": result,
+        "backend": "approximate",
+        "granularity": granularity,
+        "source": "live",
+        "tier": "approximate",
+        "scenario_applied": is_default_scenario(simulation_params),
+        "refining": refine and fit is not None and not fit.done(),
+        "computed_at": datetime.utcnow().isoformat(),
+    }
 
-    # Prepare columns for new regressors with default historical values (assumed 0 or base level)
-    # Extend as needed for actual historical regressor data if available
 
-    # Discount - default 0 (no discount historically)
-    df['discount_pct'] = 0.0
-    # Holiday - default 0 (no holiday historically)
-    df['is_holiday'] = 0
+def _discard_result(task):
+    # Retrieve the outcome of an abandoned fit so it isn't logged as unhandled
+    if not task.cancelled():
+        task.exception()
 
-    # Seasonality and Weather are categorical, encode with dummy variables
-    # Create dummy columns for example categories (extend with your categories as needed)
-    seasonality_categories = ['high', 'low', 'summer', 'winter', 'spring', 'fall']
-    weather_categories = ['sunny', 'rainy', 'snowy', 'cloudy']
 
-    for cat in seasonality_categories:
-        col_name = f"seasonality_{cat}"
-        df[col_name] = 0
+def start_refinement(user_id: int, product: str, city: str, key: str, days: int, simulation_params, daily=None):
+    """
+    Starts (or joins) a background full fit of a daily, full-history forecast
+    that is stored under its scenario key when done. Returns the task.
+    """
+    refinement = (user_id, product, city, key, days)
+    task = _refinements.get(refinement)
+    if task is None:
+        task = asyncio.ensure_future(_refine(user_id, product, city, key, days, simulation_params, daily))
+        _refinements[refinement] = task
+        task.add_done_callback(lambda done: _refinement_done(refinement, done))
+    return task
 
-    for cat in weather_categories:
-        col_name = f"weather_{cat}"
-        df[col_name] = 0
 
-    # Initialize Prophet model and add all regressors
-    m = Prophet()
-    m.add_regressor('discount_pct')
-    m.add_regressor('is_holiday')
-    for cat in seasonality_categories:
-        m.add_regressor(f"seasonality_{cat}")
-    for cat in weather_categories:
-        m.add_regressor(f"weather_{cat}")
+def _refinement_done(refinement, task):
+    _refinements.pop(refinement, None)
+    if not task.cancelled() and task.exception() is not None:
+        user_id, product, city = refinement[:3]
+        print(f"[REFINE] Full fit failed for user {user_id} {product}/{city}: {task.exception()}")
 
-    # Fit the model with historical data
-    m.fit(df)
 
-    # Create a future dataframe for the forecast period
-    future = m.make_future_dataframe(periods=days)
+async def _refine(user_id: int, product: str, city: str, key: str, days: int, simulation_params, daily=None):
+    from .precompute import DEFAULT_HORIZON_DAYS
 
-    # Populate the regressor columns in future dataframe with simulation inputs
-    future['discount_pct'] = simulation_params.discount_pct if simulation_params.discount_pct is not None else 0.0
-    future['is_holiday'] = simulation_params.is_holiday if simulation_params.is_holiday is not None else 0
+    generation = data_generation(user_id)
+    # Fit at least the standard and the stored horizon so storing never truncates
+    stored = await get_stored_forecast(user_id, product, city, key)
+    horizon = max(days, DEFAULT_HORIZON_DAYS, stored["days"] if stored else 0)
+    if daily is None:
+        daily = await load_sales_frame(user_id, product, city)
+    result, backend = await fit_forecast(user_id, product, city, daily, horizon, simulation_params)
+    if can_store(user_id, horizon, await get_stored_forecast(user_id, product, city, key), generation):
+        await save_forecast(user_id, product, city, key, backend, result)
+    return result[:days], backend
 
-    # Set all seasonality and weather dummy columns to 0 initially
-    for cat in seasonality_categories:
-        future[f"seasonality_{cat}"] = 0
-    for cat in weather_categories:
-        future[f"weather_{cat}"] = 0
 
-    # Mark the selected seasonality and weather category as 1 if provided and valid
-    if simulation_params.seasonality and simulation_params.seasonality.lower() in seasonality_categories:
-        future[f"seasonality_{simulation_params.seasonality.lower()}"] = 1
+async def compute_forecast(
+    user_id: int,
+    product: str,
+    city: str,
+    days: int,
+    simulation_params=None,
+    granularity: str = "daily",
+    history_days: Optional[int] = None,
+    uncertainty: str = "full",
+    quantiles: Optional[List[float]] = None,
+):
+    """
+    Loads the series and runs the forecast live. Returns (records, backend).
+    """
+    daily = await load_sales_frame(user_id, product, city, history_days)
+    return await fit_forecast(user_id, product, city, daily, days, simulation_params, granularity, uncertainty, quantiles)
+
+
+async def load_sales_frame(user_id: int, product: str, city: str, history_days: Optional[int] = None):
+    """
+    Loads the daily date/sales frame of a series, optionally limited to the
+    most recent history_days.
+    """
+    since = None
+    if history_days is not None:
+        latest = await get_latest_sales_date(product, city, user_id)
+        if latest is not None:
+            since = latest - timedelta(days=history_days)
+
+    sales_rows = await get_sales_data(product, city, user_id, since=since)
+    if not sales_rows:
+        raise HTTPException(status_code=404, detail="No sales data found for product/city.")
 
-    if simulation_params.weather_condition and simulation_params.weather_condition.lower() in weather_categories:
-        future[f"weather_{simulation_params.weather_condition.lower()}"] = 1
+    rows = [dict(row) for row in sales_rows]
+
+    df = pd.DataFrame(rows or [])
+    if df.empty or 'date' not in df.columns or 'sales' not in df.columns:
+        raise HTTPException(status_code=400, detail="Sales data missing or invalid for the selection")
+    return df[['date', 'sales']]
+
+
+async def fit_forecast(
+    user_id: int,
+    product: str,
+    city: str,
+    daily: pd.DataFrame,
+    days: int,
+    simulation_params=None,
+    granularity: str = "daily",
+    uncertainty: str = "full",
+    quantiles: Optional[List[float]] = None,
+):
+    """
+    Fits the best backend for the series on an already loaded frame.
+    Returns (records, backend).
+    """
+    # Aggregate to the requested granularity before fitting; fewer points fit faster
+    df = resample_sales(daily, granularity)
+    if len(df) < 2:
+        raise HTTPException(status_code=400, detail=f"Not enough history for a {granularity} forecast")
 
-    # Predict the future with regressors applied
-    forecast_df = m.predict(future)
+    # Daily baseline forecasts can use a cheaper backend if backtests showed
+    # it is as accurate as Prophet for this series
+    backend = "prophet"
+    if granularity == "daily" and is_default_scenario(simulation_params):
+        backend = choose_backend(await get_forecast_accuracy(user_id, product, city))
 
-    # Return only the forecast for the requested days (last 'days' rows)
-    result = forecast_df[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(days).to_dict(orient='records')
+    if backend == "prophet":
+        # Fit in a memory-bounded worker process; the admission controller
+        # bounds how many fits run at once and queues the rest fairly
+        async with admission.slot(user_id):
+            try:
+                result = await forecast_pool.run(
+                    prophet_forecast, df, days, simulation_params, granularity, uncertainty, quantiles
+                )
+            except WorkerMemoryError as exc:
+                raise HTTPException(status_code=503, detail=str(exc))
+    else:
+        result = await run_in_threadpool(
+            BACKENDS[backend], df, days, simulation_params, uncertainty=uncertainty, quantiles=quantiles
+        )
 
-    return {"forecast": result}
+    return result, backend
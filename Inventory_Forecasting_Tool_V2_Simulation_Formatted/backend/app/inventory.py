@@ -0,0 +1,125 @@
+import json
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, Body, Depends, HTTPException
+
+from .auth import oauth2_scheme, decode_access_token
+from .backends import INTERVAL_WIDTH
+from .crud import get_stored_forecasts
+from .precompute import scheduler
+from .schemas import InventoryPolicyRequest
+
+router = APIRouter()
+
+# z-score of the stored forecast intervals (yhat_upper - yhat is this many sigmas)
+INTERVAL_Z = NormalDist().inv_cdf(0.5 + INTERVAL_WIDTH / 2)
+
+
+def compute_reorder_policy(yhat, lower, upper, lead_time_days, service_level, current_stock):
+    """
+    Vectorized reorder policy for n series at once.
+
+    yhat/lower/upper are (n, horizon) arrays of daily forecasts (NaN-padded
+    past each series' own forecast length), the rest are length-n arrays.
+    Lead-time demand is the sum of the forecast over the lead time; its
+    sigma is recovered from the interval width and summed assuming
+    independent daily errors. Lead times beyond a series' forecast are
+    extended at its mean daily demand and variance and flagged with
+    horizon_short. Returns a dict of length-n arrays.
+    """
+    lengths = (~np.isnan(yhat)).sum(axis=1)
+    lead_time = np.clip(lead_time_days, 0, None)
+    covered = np.minimum(lead_time, lengths)
+    in_lead_time = np.arange(yhat.shape[1])[None, :] < covered[:, None]
+
+    daily_demand = np.clip(np.nan_to_num(yhat), 0, None)
+    daily_variance = np.nan_to_num((upper - lower) / (2 * INTERVAL_Z)) ** 2
+
+    # Days of lead time past the end of the forecast
+    missing = lead_time - covered
+    per_series = np.maximum(lengths, 1)
+    mean_demand = daily_demand.sum(axis=1) / per_series
+    mean_variance = daily_variance.sum(axis=1) / per_series
+
+    lead_time_demand = np.where(in_lead_time, daily_demand, 0.0).sum(axis=1) + missing * mean_demand
+    lead_time_sigma = np.sqrt(np.where(in_lead_time, daily_variance, 0.0).sum(axis=1) + missing * mean_variance)
+
+    # Service level -> z, computed once per distinct level
+    levels, inverse = np.unique(np.clip(service_level, 0.5, 0.9999), return_inverse=True)
+    z = np.array([NormalDist().inv_cdf(level) for level in levels])[inverse]
+
+    safety_stock = z * lead_time_sigma
+    reorder_point = lead_time_demand + safety_stock
+    reorder_quantity = np.clip(reorder_point - current_stock, 0, None)
+
+    return {
+        "lead_time_demand": lead_time_demand,
+        "safety_stock": safety_stock,
+        "reorder_point": reorder_point,
+        "reorder_quantity": reorder_quantity,
+        "horizon_short": lead_time > lengths,
+    }
+
+
+@router.post("/inventory-policy/")
+async def inventory_policy(
+    request: InventoryPolicyRequest = Body(...),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Returns lead-time demand, safety stock, reorder point and reorder quantity
+    per product x city from the stored default forecasts (no refitting).
+    Series without a stored forecast are listed under "missing" and queued
+    for precomputation.
+    """
+    token_data = decode_access_token(token)
+    user_id = int(token_data["user_id"])
+
+    stored = {(row["product"], row["city"]): row for row in await get_stored_forecasts(user_id)}
+    if request.items is None:
+        items = [{"product": product, "city": city} for product, city in stored]
+    else:
+        items = [item.model_dump() for item in request.items]
+    if not items:
+        raise HTTPException(status_code=404, detail="No stored forecasts found. Upload sales data first.")
+
+    found, missing = [], []
+    for item in items:
+        (found if (item["product"], item["city"]) in stored else missing).append(item)
+    if missing:
+        scheduler.schedule_user(user_id)
+    if not found:
+        return {"policies": [], "missing": [{"product": i["product"], "city": i["city"]} for i in missing]}
+
+    # Stack the stored forecasts into NaN-padded (n, horizon) matrices
+    payloads = [json.loads(stored[(i["product"], i["city"])]["payload"]) for i in found]
+    horizon = max(len(p) for p in payloads)
+    yhat, lower, upper = (np.full((len(found), horizon), np.nan) for _ in range(3))
+    for row, payload in enumerate(payloads):
+        n = len(payload)
+        yhat[row, :n] = [record["yhat"] for record in payload]
+        lower[row, :n] = [record["yhat_lower"] for record in payload]
+        upper[row, :n] = [record["yhat_upper"] for record in payload]
+
+    items_df = pd.DataFrame(found)
+    lead_time = items_df.get("lead_time_days", pd.Series([None] * len(found))).fillna(request.lead_time_days).to_numpy(dtype=int)
+    service_level = items_df.get("service_level", pd.Series([None] * len(found))).fillna(request.service_level).to_numpy(dtype=float)
+    current_stock = items_df.get("current_stock", pd.Series([0.0] * len(found))).fillna(0.0).to_numpy(dtype=float)
+
+    policy = compute_reorder_policy(yhat, lower, upper, lead_time, service_level, current_stock)
+
+    result = pd.DataFrame({
+        "product": items_df["product"],
+        "city": items_df["city"],
+        "current_stock": current_stock,
+        "lead_time_days": lead_time,
+        "service_level": service_level,
+        **policy,
+        "computed_at": [stored[(i["product"], i["city"])]["computed_at"].isoformat() for i in found],
+    })
+    return {
+        "policies": result.to_dict(orient="records"),
+        "missing": [{"product": i["product"], "city": i["city"]} for i in missing],
+    }
@@ -4,11 +4,22 @@ from fastapi.middleware.cors import CORSMiddleware
 from . import models, crud, auth
 from .schemas import UserCreate, Token
 from .forecast import router as forecast_router
-from app.models import sales_data
-from app.database import database, engine, metadata
+from .backtest import router as backtest_router
+from .inventory import router as inventory_router
+from .profiling import router as profiling_router, ProfilingMiddleware
+from .admission import admission
+from .partitions import ensure_sales_partitioning, PartitionBusyError, SWAP_LOCK_TIMEOUT_MS, SERIES_INDEX_COLUMNS
+from .precompute import scheduler
+from .workers import forecast_pool, backtest_pool
+from app.database import database, engine, metadata, IS_SQLITE
 from sqlalchemy import inspect, text
 import io
+import json
 import pandas as pd
+from datetime import date
+from typing import Optional
+from fastapi.responses import StreamingResponse
+from .utils import encode_cursor, decode_cursor
 
 app = FastAPI(title="Inventory Forecasting API")
 
@@ -19,16 +30,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id"],
 )
 
+# Admin-only per-request profiling (X-Profile: 1 or ?profile=1)
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(forecast_router, tags=["forecast"])
+app.include_router(backtest_router, tags=["backtest"])
+app.include_router(inventory_router, tags=["inventory"])
+app.include_router(profiling_router, tags=["admin"])
 
 
 # ---------- Auto Schema Upgrade Helper ----------
 async def upgrade_schema_if_needed():
     """
-    Ensures the sales_data table contains all expected simulation columns.
-    Creates the table if it doesn't exist.
+    Ensures the sales_data table contains all expected simulation columns
+    and is partitioned by user_id (PostgreSQL only). Creates the table if it
+    doesn't exist.
     """
     inspector = inspect(engine)
 
@@ -37,9 +56,13 @@ async def upgrade_schema_if_needed():
         # Table doesn't exist yet — create all tables
         metadata.create_all(bind=engine)
         print("[DB INIT] Created all tables (sales_data missing).")
+        ensure_series_storage()
         return
 
-    # Table exists — check for missing columns
+    # Table exists — create any newer tables (e.g. forecast_accuracy)
+    metadata.create_all(bind=engine)
+
+    # Check for missing columns
     existing_columns = [col["name"] for col in inspector.get_columns("sales_data")]
 
     expected_columns = {
@@ -55,16 +78,48 @@ async def upgrade_schema_if_needed():
                 alter_sql = f'ALTER TABLE sales_data ADD COLUMN "{col_name}" {col_type}'
                 conn.execute(text(alter_sql))
                 print(f"[DB UPGRADE] Added missing column: {col_name}")
+        conn.commit()
+
+    ensure_series_storage()
+
+
+def ensure_series_storage():
+    if not IS_SQLITE:
+        # Partition sales_data by user_id so uploads can swap a tenant's data atomically
+        ensure_sales_partitioning(engine)
+    ensure_series_index()
+
+
+def ensure_series_index():
+    """
+    Creates ix_sales_data_series, or rebuilds it when an older version of the
+    index has different columns. On PostgreSQL the index on the partitioned
+    table cascades to every partition.
+    """
+    existing = {ix["name"]: ix["column_names"] for ix in inspect(engine).get_indexes("sales_data")}
+    if existing.get("ix_sales_data_series") == SERIES_INDEX_COLUMNS:
+        return
+    with engine.begin() as conn:
+        if "ix_sales_data_series" in existing:
+            conn.execute(text("DROP INDEX ix_sales_data_series"))
+        conn.execute(text(
+            f"CREATE INDEX ix_sales_data_series ON sales_data ({', '.join(SERIES_INDEX_COLUMNS)})"
+        ))
+    print(f"[DB UPGRADE] Built ix_sales_data_series on ({', '.join(SERIES_INDEX_COLUMNS)}).")
 
 
 @app.on_event("startup")
 async def startup():
     await database.connect()
     await upgrade_schema_if_needed()
+    scheduler.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await scheduler.stop()
+    forecast_pool.shutdown()
+    backtest_pool.shutdown()
     await database.disconnect()
 
 
@@ -109,13 +164,36 @@ async def upload_sales(file: UploadFile = File(...), token: str = Depends(auth.o
     except ValueError:
         df['date'] = pd.to_datetime(df['date'], dayfirst=True).dt.date
 
-    # Remove previous data for this user
-    delete_query = sales_data.delete().where(sales_data.c.user_id == user_id)
-    await database.execute(delete_query)
-
-    # Add new data (simulation columns auto-handled if present)
+    # Every row needs a product, city, date and numeric sales figure
+    df['sales'] = pd.to_numeric(df['sales'], errors='coerce')
+    invalid = df[list(required_cols)].isna().any(axis=1)
+    if invalid.any():
+        # File line numbers: 1-based, after the header row
+        lines = (df.index[invalid] + 2).tolist()
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(lines)} rows are missing product, city, date or sales (lines {lines[:10]})",
+        )
+
+    # Replace this user's data in one atomic partition swap
+    # (simulation columns auto-handled if present)
     data_rows = df.to_dict(orient='records')
-    await crud.add_sales_data(data_rows, user_id)
+    # Fits already running over the old data must not store their results
+    scheduler.invalidate_user(user_id)
+    try:
+        await crud.replace_sales_data(data_rows, user_id)
+    except PartitionBusyError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(exc),
+            headers={"Retry-After": str(max(1, SWAP_LOCK_TIMEOUT_MS // 1000))},
+        )
+
+    # Stored forecasts are now out of date - drop them and precompute new ones.
+    # Invalidate again first: fits started during the swap may have read old rows.
+    scheduler.invalidate_user(user_id)
+    await crud.delete_stored_forecasts(user_id)
+    scheduler.schedule_user(user_id)
 
     return {"msg": f"Uploaded {len(data_rows)} sales rows"}
 
@@ -178,3 +256,109 @@ async def available_options(token: str = Depends(auth.oauth2_scheme)):
         "holiday": holiday,
         "default_simulation": default_simulation
     }
+
+
+# ---------------------------------------------
+# Endpoint: Browse raw sales data (keyset pages or stream)
+# ---------------------------------------------
+MAX_BROWSE_PAGE_SIZE = 5000
+
+
+def _sales_row_json(row) -> dict:
+    row = dict(row)
+    row["date"] = row["date"].isoformat()
+    return row
+
+
+@app.get("/sales-data/")
+async def browse_sales_data(
+    product: Optional[str] = None,
+    city: Optional[str] = None,
+    seasonality: Optional[str] = None,
+    weather_condition: Optional[str] = None,
+    is_holiday: Optional[int] = None,
+    min_discount: Optional[float] = None,
+    max_discount: Optional[float] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = 500,
+    stream: bool = False,
+    token: str = Depends(auth.oauth2_scheme)
+):
+    """
+    Returns the user's uploaded rows ordered by (product, city, date, id).
+    Pages are keyset-based: pass the returned next_cursor to get the next
+    page. With stream=true every matching row after the cursor is streamed
+    as newline-delimited JSON from a database cursor, so memory stays flat
+    however much data the user has.
+    """
+    token_data = auth.decode_access_token(token)
+    user_id = int(token_data['user_id'])
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    filters = {
+        "product": product,
+        "city": city,
+        "seasonality": seasonality,
+        "weather_condition": weather_condition,
+        "is_holiday": is_holiday,
+        "min_discount": min_discount,
+        "max_discount": max_discount,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+
+    if stream:
+        query = crud.sales_browse_query(user_id, filters, after)
+
+        async def rows():
+            async for row in database.iterate(query):
+                yield json.dumps(_sales_row_json(row)) + "\n"
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    limit = max(1, min(limit, MAX_BROWSE_PAGE_SIZE))
+    # Fetch one extra row to know whether there is a next page
+    page = await database.fetch_all(crud.sales_browse_query(user_id, filters, after, limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = page[-1]
+        next_cursor = encode_cursor(last["product"], last["city"], last["date"], last["id"])
+
+    return {"rows": [_sales_row_json(row) for row in page], "next_cursor": next_cursor}
+
+
+# ---------------------------------------------
+# Endpoint: Forecast admission metrics
+# ---------------------------------------------
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """
+    Returns concurrency, queue depth and queue wait-time metrics for forecast fits.
+    """
+    return admission.metrics()
+
+
+# ---------------------------------------------
+# Endpoint: Forecast worker memory metrics
+# ---------------------------------------------
+@app.get("/metrics/workers")
+async def worker_metrics():
+    """
+    Returns per-task peak RSS, recycling counts and recent task stats for the
+    forecast and backtest worker pools.
+    """
+    return {
+        "forecast": forecast_pool.metrics(),
+        "backtest": backtest_pool.metrics(),
+    }
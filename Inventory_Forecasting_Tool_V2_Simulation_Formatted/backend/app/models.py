@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Table, Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, UniqueConstraint
 from .database import metadata
 
 users = Table(
@@ -26,3 +26,35 @@ sales_data = Table(
     Column("is_holiday", Integer, nullable=True),           # 1=holiday, 0=not holiday
     Column("weather_condition", String, nullable=True)      # E.g., "rainy", "sunny", etc.
 )
+
+# Rolling-origin backtest accuracy, one row per user x series x backend
+forecast_accuracy = Table(
+    "forecast_accuracy",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), index=True, nullable=False),
+    Column("product", String, nullable=False),
+    Column("city", String, nullable=False),
+    Column("backend", String, nullable=False),       # e.g. "prophet", "seasonal_naive"
+    Column("mape", Float, nullable=True),            # Mean absolute percentage error, in %
+    Column("rmse", Float, nullable=True),
+    Column("folds", Integer, nullable=False),
+    Column("horizon", Integer, nullable=False),      # Days forecast per fold
+    Column("evaluated_at", DateTime, nullable=False)
+)
+
+# Persisted forecast results, one row per user x series x scenario
+forecasts = Table(
+    "forecasts",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), index=True, nullable=False),
+    Column("product", String, nullable=False),
+    Column("city", String, nullable=False),
+    Column("scenario_key", String, nullable=False),  # "default" or a JSON key of the simulation inputs
+    Column("days", Integer, nullable=False),         # Horizon stored in the payload
+    Column("backend", String, nullable=False),
+    Column("payload", Text, nullable=False),         # JSON list of forecast records
+    Column("computed_at", DateTime, nullable=False),
+    UniqueConstraint("user_id", "product", "city", "scenario_key", name="uq_forecasts_series_scenario")
+)
@@ -0,0 +1,163 @@
+"""
+Per-tenant LIST partitioning of the sales_data table (PostgreSQL).
+
+Every user's rows live in their own partition named sales_data_u<user_id>.
+Uploads are loaded into a fresh staging table and swapped in with
+DETACH/ATTACH inside one transaction, so replacing a tenant's data never
+deletes rows one by one and readers never see a half-loaded dataset.
+"""
+import os
+import uuid
+from typing import List
+
+from sqlalchemy import text
+
+from .database import database
+from .models import sales_data
+
+SALES_COLUMNS = [col.name for col in sales_data.columns if col.name != "id"]
+
+# Index serving the series loaders and the keyset-paginated browse ordering
+SERIES_INDEX_COLUMNS = ["user_id", "product", "city", "date", "id"]
+
+# Indexes on the partitioned sales_data. Every partition gets a matching
+# local index, which ATTACH links instead of building.
+SALES_INDEXES = {
+    "ix_sales_data_product": ["product"],
+    "ix_sales_data_city": ["city"],
+    "ix_sales_data_series": SERIES_INDEX_COLUMNS,
+}
+
+# How long an upload waits for the lock on sales_data before giving up
+SWAP_LOCK_TIMEOUT_MS = int(os.getenv("UPLOAD_LOCK_TIMEOUT_MS", 5000))
+
+
+class PartitionBusyError(RuntimeError):
+    """The swap could not lock sales_data in time - retry the upload later."""
+
+
+def partition_name(user_id: int) -> str:
+    return f"sales_data_u{int(user_id)}"
+
+
+# ---------- Schema migration (sync, runs at startup) ----------
+
+def is_partitioned(conn) -> bool:
+    query = text(
+        "SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'sales_data'"
+    )
+    return conn.execute(query).first() is not None
+
+
+def _column_ddl(dialect) -> str:
+    parts = []
+    for col in sales_data.columns:
+        ddl = f'"{col.name}" {col.type.compile(dialect=dialect)}'
+        if col.name == "id":
+            ddl += " DEFAULT nextval('sales_data_id_seq')"
+        if not col.nullable or col.primary_key:
+            ddl += " NOT NULL"
+        if col.name == "user_id":
+            ddl += " REFERENCES users (id)"
+        parts.append(ddl)
+    # The partition key must be part of the primary key
+    parts.append("PRIMARY KEY (user_id, id)")
+    return ",\n    ".join(parts)
+
+
+def ensure_sales_partitioning(engine):
+    """
+    Converts a plain sales_data table into one partitioned by user_id.
+    Existing rows are copied into one partition per user. No-op if the
+    table is already partitioned.
+    """
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return
+
+        user_ids = [row[0] for row in conn.execute(text("SELECT DISTINCT user_id FROM sales_data"))]
+        all_columns = ", ".join(f'"{col.name}"' for col in sales_data.columns)
+
+        # Keep the id sequence alive when the old table is dropped
+        conn.execute(text("ALTER SEQUENCE sales_data_id_seq OWNED BY NONE"))
+        conn.execute(text("ALTER TABLE sales_data RENAME TO sales_data_unpartitioned"))
+        conn.execute(text(
+            f"CREATE TABLE sales_data (\n    {_column_ddl(engine.dialect)}\n) PARTITION BY LIST (user_id)"
+        ))
+        conn.execute(text("ALTER SEQUENCE sales_data_id_seq OWNED BY sales_data.id"))
+
+        for user_id in user_ids:
+            conn.execute(text(
+                f"CREATE TABLE {partition_name(user_id)} PARTITION OF sales_data FOR VALUES IN ({int(user_id)})"
+            ))
+        conn.execute(text(
+            f"INSERT INTO sales_data ({all_columns}) SELECT {all_columns} FROM sales_data_unpartitioned"
+        ))
+        conn.execute(text("DROP TABLE sales_data_unpartitioned"))
+
+        for name, columns in SALES_INDEXES.items():
+            conn.execute(text(f"CREATE INDEX {name} ON sales_data ({', '.join(columns)})"))
+
+    print(f"[DB UPGRADE] Partitioned sales_data by user_id ({len(user_ids)} partitions).")
+
+
+# ---------- Atomic upload swap (async, runs per upload) ----------
+
+async def swap_user_partition(user_id: int, data_rows: List[dict]):
+    """
+    Loads data_rows into a staging table with COPY, then atomically swaps it
+    in as the user's partition. The previous partition is dropped as a whole.
+
+    The primary key, indexes and users foreign key are built on the staging
+    table before the swap, so ATTACH only links them to the parent's and the
+    locked part of the swap takes the same time whatever the upload size.
+    DETACH/ATTACH lock the whole sales_data table, so the swap waits at most
+    SWAP_LOCK_TIMEOUT_MS for running readers and raises PartitionBusyError
+    instead of queueing every other tenant's queries behind it.
+    """
+    user_id = int(user_id)
+    partition = partition_name(user_id)
+    staging = f"sales_data_stage_{user_id}_{uuid.uuid4().hex[:8]}"
+
+    await database.execute(f"CREATE TABLE {staging} (LIKE sales_data INCLUDING DEFAULTS)")
+    try:
+        # Matching CHECK constraint lets ATTACH skip its validation scan
+        await database.execute(
+            f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_user_check CHECK (user_id = {user_id})"
+        )
+
+        records = [tuple(row.get(col) for col in SALES_COLUMNS) for row in data_rows]
+        async with database.connection() as connection:
+            await connection.raw_connection.copy_records_to_table(
+                staging, records=records, columns=SALES_COLUMNS
+            )
+
+        # Build after the COPY (one sort per index instead of per-row updates)
+        await database.execute(f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_pkey PRIMARY KEY (user_id, id)")
+        for name, columns in SALES_INDEXES.items():
+            suffix = name[len("ix_sales_data_"):]
+            await database.execute(f"CREATE INDEX {staging}_{suffix} ON {staging} ({', '.join(columns)})")
+        await database.execute(
+            f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_user_fkey "
+            f"FOREIGN KEY (user_id) REFERENCES users (id)"
+        )
+
+        async with database.transaction():
+            await database.execute(f"SET LOCAL lock_timeout = {SWAP_LOCK_TIMEOUT_MS}")
+            exists = await database.fetch_val(f"SELECT to_regclass('{partition}') IS NOT NULL")
+            if exists:
+                await database.execute(f"ALTER TABLE sales_data DETACH PARTITION {partition}")
+            await database.execute(
+                f"ALTER TABLE sales_data ATTACH PARTITION {staging} FOR VALUES IN ({user_id})"
+            )
+            if exists:
+                await database.execute(f"DROP TABLE {partition}")
+            await database.execute(f"ALTER TABLE {staging} RENAME TO {partition}")
+    except Exception as exc:
+        await database.execute(f"DROP TABLE IF EXISTS {staging}")
+        # 55P03 = lock_not_available
+        if getattr(exc, "sqlstate", None) == "55P03":
+            raise PartitionBusyError("sales_data is busy, retry the upload") from exc
+        raise
@@ -0,0 +1,99 @@
+import asyncio
+import os
+
+from fastapi import HTTPException
+
+from . import crud
+from .admission import admission
+from .forecast import compute_forecast
+
+# Horizon precomputed for every series (the standard /forecast/ request)
+DEFAULT_HORIZON_DAYS = int(os.getenv("PRECOMPUTE_HORIZON_DAYS", 30))
+# How often every tenant's default forecasts are refreshed
+PRECOMPUTE_INTERVAL_SECONDS = int(os.getenv("PRECOMPUTE_INTERVAL_SECONDS", 6 * 3600))
+
+
+class PrecomputeScheduler:
+    """
+    In-process scheduler that stores the default-scenario forecast for every
+    series. Runs for a user right after each upload and for all users on a
+    fixed cadence. Fits go through the admission controller like any other
+    request, so precomputation never takes more than its fair share.
+    """
+
+    def __init__(self, interval_seconds: int, horizon_days: int):
+        self.interval_seconds = interval_seconds
+        self.horizon_days = horizon_days
+        self.queue: "asyncio.Queue[int]" = asyncio.Queue()
+        self.pending = set()
+        # Bumped on every upload so a run over replaced data doesn't store results
+        self.generations = {}
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._worker()),
+            asyncio.create_task(self._periodic()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def schedule_user(self, user_id: int):
+        # Coalesce repeated requests for a user that is already queued
+        if user_id in self.pending:
+            return
+        self.pending.add(user_id)
+        self.queue.put_nowait(user_id)
+
+    def invalidate_user(self, user_id: int):
+        # The user's data is being replaced: results of any fit in flight are stale
+        self.generations[user_id] = self.generations.get(user_id, 0) + 1
+
+    async def _periodic(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            for user_id in await crud.get_users_with_sales():
+                self.schedule_user(user_id)
+
+    async def _worker(self):
+        while True:
+            user_id = await self.queue.get()
+            self.pending.discard(user_id)
+            try:
+                await self.precompute_user(user_id)
+            except Exception as exc:
+                print(f"[PRECOMPUTE] Failed for user {user_id}: {exc}")
+
+    async def precompute_user(self, user_id: int):
+        generation = self.generations.get(user_id, 0)
+        series = await crud.get_series(user_id)
+        stored = 0
+        for product, city in series:
+            try:
+                records, backend = await self._forecast_series(user_id, product, city)
+            except Exception as exc:
+                # One bad series (e.g. too little history) must not hold up the rest
+                print(f"[PRECOMPUTE] Failed for user {user_id} {product}/{city}: {exc}")
+                continue
+            if self.generations.get(user_id, 0) != generation:
+                return
+            await crud.save_forecast(user_id, product, city, "default", backend, records)
+            stored += 1
+        print(f"[PRECOMPUTE] Stored default forecasts for user {user_id} ({stored}/{len(series)} series).")
+
+    async def _forecast_series(self, user_id: int, product: str, city: str):
+        while True:
+            try:
+                return await compute_forecast(user_id, product, city, self.horizon_days)
+            except HTTPException as exc:
+                if exc.status_code not in (429, 503) or not (exc.headers or {}).get("Retry-After"):
+                    raise
+                # Forecast queue is busy - back off and retry
+                await asyncio.sleep(admission.retry_after_seconds())
+
+
+scheduler = PrecomputeScheduler(PRECOMPUTE_INTERVAL_SECONDS, DEFAULT_HORIZON_DAYS)
@@ -0,0 +1,164 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import re
+import tempfile
+import uuid
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from . import crud
+from .auth import oauth2_scheme, decode_access_token
+from .workers import worker_profiles
+
+router = APIRouter()
+
+# Where captured profiles are kept, and how many of them
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "inventory-profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 50))
+
+# Only these endpoints can be profiled
+PROFILED_PATHS = ("/forecast/", "/upload-sales/")
+PROFILE_HEADER = b"x-profile"
+
+# cProfile allows one active profiler per thread, so profiled requests take turns
+_profile_lock = asyncio.Lock()
+
+
+def _profile_requested(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER and value in (b"1", b"true"):
+            return True
+    return re.search(rb"(^|&)profile=(1|true)(&|$)", scope.get("query_string", b"")) is not None
+
+
+async def _is_admin(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode().partition(" ")
+            if scheme.lower() != "bearer":
+                return False
+            try:
+                user_id = int(decode_access_token(token)["user_id"])
+            except HTTPException:
+                return False
+            user = await crud.get_user_by_id(user_id)
+            return user is not None and user["role"] == "admin"
+    return False
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single /forecast/ or /upload-sales/ request when an admin asks
+    for it with an "X-Profile: 1" header or "profile=1" query flag.
+
+    The request handler runs under cProfile, and fits that run in worker
+    processes are profiled there and merged in. The profile is saved under
+    PROFILE_DIR and its id returned in the X-Profile-Id response header.
+    Other coroutines sharing the event loop during the request show up in
+    the profile too. Requests without the flag only pay for the path check.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in PROFILED_PATHS or not _profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not await _is_admin(scope):
+            # Not allowed to profile - serve the request normally
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        async with _profile_lock:
+            collected = []
+            token = worker_profiles.set(collected)
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profiler.disable()
+                worker_profiles.reset(token)
+                save_profile(profile_id, profiler, collected)
+
+
+def _profile_path(profile_id: str) -> str:
+    if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+
+
+def save_profile(profile_id: str, profiler: cProfile.Profile, worker_profiles: List[bytes]):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stats = pstats.Stats(profiler)
+    for n, data in enumerate(worker_profiles):
+        worker_path = os.path.join(PROFILE_DIR, f"{profile_id}-worker-{n}.tmp")
+        with open(worker_path, "wb") as f:
+            f.write(data)
+        stats.add(worker_path)
+        os.remove(worker_path)
+    stats.dump_stats(_profile_path(profile_id))
+
+    # Keep only the newest PROFILE_KEEP profiles
+    saved = sorted(
+        (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")),
+        key=os.path.getmtime,
+    )
+    for old in saved[:-PROFILE_KEEP]:
+        os.remove(old)
+
+
+# ---------- Retrieval endpoints (admins only) ----------
+
+async def get_admin_user(token: str = Depends(oauth2_scheme)):
+    token_data = decode_access_token(token)
+    user = await crud.get_user_by_id(int(token_data["user_id"]))
+    if user is None or user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+    return user
+
+
+@router.get("/admin/profiles/")
+async def list_profiles(admin=Depends(get_admin_user)):
+    if not os.path.isdir(PROFILE_DIR):
+        return {"profiles": []}
+    names = sorted(
+        (name for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")),
+        key=lambda name: os.path.getmtime(os.path.join(PROFILE_DIR, name)),
+        reverse=True,
+    )
+    return {"profiles": [name[:-len(".prof")] for name in names]}
+
+
+@router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "text", sort: str = "cumulative", limit: int = 50,
+                      admin=Depends(get_admin_user)):
+    """
+    Returns a saved profile as a pstats text report (format=text) or as the
+    raw .prof file (format=raw) for snakeviz and similar tools.
+    """
+    path = _profile_path(profile_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "raw":
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+    out = io.StringIO()
+    try:
+        pstats.Stats(path, stream=out).sort_stats(sort).print_stats(limit)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort}")
+    return PlainTextResponse(out.getvalue())
@@ -7,7 +7,6 @@ from datetime import date
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
-    role: Optional[str] = "manager"
 
 class User(BaseModel):
     id: int
@@ -57,3 +56,17 @@ class AvailableOptions(BaseModel):
     weather: List[str]
     holiday: List[int]
     default_simulation: SimulationParams
+
+# --- Inventory policy (reorder point / safety stock) ---
+
+class InventoryPolicyItem(BaseModel):
+    product: str
+    city: str
+    current_stock: float = 0.0
+    lead_time_days: Optional[int] = None             # Overrides the request default
+    service_level: Optional[float] = None            # Overrides the request default, e.g. 0.95
+
+class InventoryPolicyRequest(BaseModel):
+    items: Optional[List[InventoryPolicyItem]] = None   # None = every series with a stored forecast
+    lead_time_days: int = 7
+    service_level: float = 0.95
@@ -1 +1,25 @@
 # Utilities (If needed) - e.g., date parsing, data conversion may be added here
+
+import base64
+import json
+from datetime import date
+
+
+def encode_cursor(product: str, city: str, row_date: date, row_id: int) -> str:
+    """
+    Opaque keyset cursor for the sales-data browse endpoint.
+    """
+    raw = json.dumps([product, city, row_date.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    Returns (product, city, date, id) or raises ValueError for a bad cursor.
+    """
+    try:
+        product, city, row_date, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return product, city, date.fromisoformat(row_date), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
@@ -0,0 +1,343 @@
+import asyncio
+import cProfile
+import marshal
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+from multiprocessing import util
+from typing import List, Optional
+
+from .admission import MAX_CONCURRENT_FITS
+
+MB = 1024 * 1024
+
+# Forecast worker processes - override with environment variables
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", MAX_CONCURRENT_FITS))
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", os.cpu_count() or 2))
+# Recycle a worker after this many tasks...
+WORKER_MAX_TASKS = int(os.getenv("FORECAST_WORKER_MAX_TASKS", 50))
+# ...or once its resident memory grows past this many MB
+WORKER_RECYCLE_RSS_MB = int(os.getenv("FORECAST_WORKER_RECYCLE_RSS_MB", 1024))
+# Hard address-space ceiling per worker (and its Stan subprocess) in MB, 0 = none
+WORKER_MEMORY_LIMIT_MB = int(os.getenv("FORECAST_WORKER_MEMORY_LIMIT_MB", 0))
+
+RSS_SAMPLE_SECONDS = 0.05
+
+# Set in each worker process by _init_worker
+_worker_tmpdir: Optional[str] = None
+
+# Set by the profiling middleware while an admin-requested profile is being
+# captured; tasks run then are profiled in the worker and their stats collected here
+worker_profiles: ContextVar[Optional[List[bytes]]] = ContextVar("worker_profiles", default=None)
+
+
+class WorkerMemoryError(RuntimeError):
+    pass
+
+
+def _process_rss_bytes(pid="self") -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _rss_bytes() -> int:
+    try:
+        return _process_rss_bytes()
+    except (OSError, ValueError):
+        # Not Linux: fall back to the lifetime peak (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _child_pids(pid: int) -> List[int]:
+    if os.path.exists(f"/proc/{pid}/task/{pid}/children"):
+        children = []
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            try:
+                with open(f"/proc/{pid}/task/{tid}/children") as f:
+                    children.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass  # Thread exited
+        return children
+
+    # Kernel without the children file: find them by parent pid
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The ppid follows the ")" that closes the command name
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    children.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            pass
+    return children
+
+
+def _children_rss_bytes() -> int:
+    """
+    Current RSS of every process started by this worker, i.e. the Stan
+    binaries, summed. 0 where /proc isn't available.
+    """
+    total = 0
+    try:
+        pending = _child_pids(os.getpid())
+    except OSError:
+        return 0
+    while pending:
+        pid = pending.pop()
+        try:
+            total += _process_rss_bytes(pid)
+            pending.extend(_child_pids(pid))
+        except (OSError, ValueError):
+            pass  # Exited while we looked
+    return total
+
+
+def _init_worker(memory_limit_bytes: int):
+    """
+    Runs once in every worker process: gives it a private temp directory
+    (cmdstanpy creates its scratch dir there on import) and applies the
+    memory ceiling.
+    """
+    global _worker_tmpdir
+    _worker_tmpdir = tempfile.mkdtemp(prefix="forecast-worker-")
+    os.environ["TMPDIR"] = _worker_tmpdir
+    tempfile.tempdir = _worker_tmpdir
+    util.Finalize(None, shutil.rmtree, args=(_worker_tmpdir,), kwargs={"ignore_errors": True}, exitpriority=10)
+
+    if memory_limit_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+
+def _clean_tmpdir():
+    # Remove Stan inputs/outputs left behind by the last fit, keeping
+    # cmdstanpy's own scratch directory (it is created only once per process)
+    if not _worker_tmpdir:
+        return
+    cmdstanpy = sys.modules.get("cmdstanpy")
+    keep = getattr(cmdstanpy, "_TMPDIR", None)
+    for root in filter(None, [_worker_tmpdir, keep]):
+        if not os.path.isdir(root):
+            continue
+        for entry in os.listdir(root):
+            path = os.path.join(root, entry)
+            if path == keep:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def _run_task(fn, args, profile=False):
+    """
+    Runs fn(*args) in the worker while a sampler thread tracks the peak RSS
+    of the worker and, separately, of the Stan processes it starts.
+    Returns (result, stats). With profile=True the call runs under cProfile
+    and stats["profile"] holds the marshalled pstats data.
+    """
+    peak = [_rss_bytes()]
+    children_peak = [0]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            peak[0] = max(peak[0], _rss_bytes())
+            children_peak[0] = max(children_peak[0], _children_rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    profiler = cProfile.Profile() if profile else None
+    started = time.monotonic()
+    try:
+        if profiler:
+            profiler.enable()
+        result = fn(*args)
+    except MemoryError:
+        raise WorkerMemoryError("Forecast exceeded the worker memory limit")
+    finally:
+        if profiler:
+            profiler.disable()
+        done.set()
+        sampler.join()
+        _clean_tmpdir()
+
+    rss_after = _rss_bytes()
+    stats = {
+        "pid": os.getpid(),
+        "seconds": time.monotonic() - started,
+        "peak_rss_bytes": max(peak[0], rss_after),
+        "rss_after_bytes": rss_after,
+        "stan_peak_rss_bytes": children_peak[0],
+    }
+    if profiler:
+        profiler.create_stats()
+        stats["profile"] = marshal.dumps(profiler.stats)
+    return result, stats
+
+
+class ForecastWorkerPool:
+    """
+    Process pool for Prophet/cmdstanpy fits. Keeps the long-running API
+    process small: each task reports its peak RSS, workers are replaced
+    after WORKER_MAX_TASKS tasks or as soon as one grows past the recycle
+    threshold, and Stan temp files are removed after every task.
+
+    Every worker is its own single-process executor, handed out to one task
+    at a time, so recycling replaces only the offending worker and the
+    others keep their warm Prophet/cmdstanpy imports.
+    """
+
+    def __init__(self, workers: int, max_tasks: int, recycle_rss_bytes: int, memory_limit_bytes: int):
+        self.workers = max(1, workers)
+        self.max_tasks = max_tasks
+        self.recycle_rss_bytes = recycle_rss_bytes
+        self.memory_limit_bytes = memory_limit_bytes
+        self._executors: List[Optional[ProcessPoolExecutor]] = [None] * self.workers
+        self._idle: Optional[asyncio.Queue] = None
+
+        # Metrics
+        self.tasks_total = 0
+        self.failures_total = 0
+        self.recycles_total = 0
+        self.recent = deque(maxlen=500)
+
+    def _idle_workers(self) -> asyncio.Queue:
+        # Indexes of the workers not running a task
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for index in range(self.workers):
+                self._idle.put_nowait(index)
+        return self._idle
+
+    def _get_executor(self, index: int) -> ProcessPoolExecutor:
+        # Created lazily so importing the app doesn't spawn processes
+        if self._executors[index] is None:
+            self._executors[index] = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.memory_limit_bytes,),
+                max_tasks_per_child=self.max_tasks or None,
+            )
+        return self._executors[index]
+
+    def _recycle(self, index: int):
+        # The next task on this worker starts a fresh process
+        executor = self._executors[index]
+        if executor is not None:
+            self._executors[index] = None
+            self.recycles_total += 1
+            executor.shutdown(wait=False)
+
+    async def run(self, fn, *args):
+        idle = self._idle_workers()
+        index = await idle.get()
+        loop = asyncio.get_running_loop()
+        collected = worker_profiles.get()
+        try:
+            future = loop.run_in_executor(self._get_executor(index), _run_task, fn, args, collected is not None)
+        except BaseException:
+            idle.put_nowait(index)
+            raise
+
+        try:
+            result, stats = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The worker process keeps running the task - only hand the
+            # worker to the next task once it has actually finished
+            future.add_done_callback(lambda done: self._finish_abandoned(index, done))
+            raise
+        except BrokenProcessPool:
+            # The worker died (e.g. OOM-killed) - replace it
+            self.failures_total += 1
+            self._recycle(index)
+            idle.put_nowait(index)
+            raise WorkerMemoryError("Forecast worker died while running the task")
+        except WorkerMemoryError:
+            self.failures_total += 1
+            self._recycle(index)
+            idle.put_nowait(index)
+            raise
+        except BaseException:
+            idle.put_nowait(index)
+            raise
+
+        if collected is not None:
+            collected.append(stats.pop("profile"))
+        self._record(index, stats)
+        idle.put_nowait(index)
+        return result
+
+    def _record(self, index: int, stats: dict):
+        self.tasks_total += 1
+        self.recent.append(stats)
+        if self.recycle_rss_bytes and stats["rss_after_bytes"] > self.recycle_rss_bytes:
+            self._recycle(index)
+
+    def _finish_abandoned(self, index: int, future):
+        if future.cancelled() or future.exception() is not None:
+            self.failures_total += 1
+            self._recycle(index)
+        else:
+            _, stats = future.result()
+            stats.pop("profile", None)
+            self._record(index, stats)
+        self._idle_workers().put_nowait(index)
+
+    def busy_workers(self) -> int:
+        return self.workers - self._idle_workers().qsize()
+
+    def shutdown(self):
+        for index, executor in enumerate(self._executors):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executors[index] = None
+
+    def metrics(self) -> dict:
+        peaks = sorted(s["peak_rss_bytes"] for s in self.recent)
+        stan_peaks = sorted(s["stan_peak_rss_bytes"] for s in self.recent)
+
+        def percentile(values, p):
+            if not values:
+                return 0
+            return values[min(len(values) - 1, int(p * len(values)))]
+
+        return {
+            "workers": self.workers,
+            "busy_workers": self.busy_workers(),
+            "max_tasks_per_worker": self.max_tasks,
+            "recycle_rss_bytes": self.recycle_rss_bytes,
+            "memory_limit_bytes": self.memory_limit_bytes,
+            "tasks_total": self.tasks_total,
+            "failures_total": self.failures_total,
+            "recycles_total": self.recycles_total,
+            "task_peak_rss_bytes_p50": percentile(peaks, 0.50),
+            "task_peak_rss_bytes_p95": percentile(peaks, 0.95),
+            "task_peak_rss_bytes_max": peaks[-1] if peaks else 0,
+            "stan_peak_rss_bytes_p95": percentile(stan_peaks, 0.95),
+            "stan_peak_rss_bytes_max": stan_peaks[-1] if stan_peaks else 0,
+            "recent_tasks": list(self.recent)[-20:],
+        }
+
+
+forecast_pool = ForecastWorkerPool(
+    FORECAST_WORKERS, WORKER_MAX_TASKS, WORKER_RECYCLE_RSS_MB * MB, WORKER_MEMORY_LIMIT_MB * MB
+)
+backtest_pool = ForecastWorkerPool(
+    BACKTEST_WORKERS, WORKER_MAX_TASKS, WORKER_RECYCLE_RSS_MB * MB, WORKER_MEMORY_LIMIT_MB * MB
+)
@@ -0,0 +1,275 @@
+"""
+End-to-end load generator for the Inventory Forecasting API.
+
+Starts the FastAPI app in-process on a throwaway SQLite database (or targets
+a running server with --url), registers a set of tenants, uploads sample
+data for each, then drives a weighted mix of requests and reports
+throughput, p50/p95/p99 latency and error rates per endpoint, plus
+event-loop lag. Only the driven phase is measured; the setup requests are
+summarised on their own line.
+
+Event-loop lag is sampled in this process. In-process that is the app's
+own loop; with --url it is the load generator's loop, not the server's.
+
+Usage (from the backend directory):
+    python loadtest.py --tenants 20 --duration 60 --mix forecast=1,available-options=5,upload=1,token=2
+
+Mix endpoints: forecast, available-options, upload, token and register
+(signs up a brand-new account and logs in with it).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+DEFAULT_MIX = "forecast=1,available-options=5,upload=1,token=2"
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SampleData", "Sample3.csv")
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.loop_lag = []
+
+    def record(self, endpoint: str, seconds: float, status):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+        # Rejections from admission control (429/503) are expected under load
+        # and reported on their own; anything else non-2xx is an error
+        if status == "exception" or (isinstance(status, int) and status >= 400 and status not in (429, 503)):
+            self.errors[endpoint] += 1
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def monitor_loop_lag(stats: Stats, interval: float, stop: asyncio.Event):
+    # Sleep for a fixed interval and record how late the loop wakes us up
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(max(0.0, loop.time() - started - interval))
+
+
+class Tenant:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, index: int, data: bytes):
+        self.client = client
+        self.stats = stats
+        self.index = index
+        self.signups = 0
+        self.email = f"loadtest-{os.getpid()}-{index}@example.com"
+        self.password = "loadtest-password"
+        self.data = data
+        self.headers = {}
+        self.series = []
+
+    async def call(self, endpoint: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+        except Exception:
+            response, status = None, "exception"
+        self.stats.record(endpoint, time.perf_counter() - started, status)
+        return response
+
+    async def register(self):
+        await self.call("register", "POST", "/register", json={"email": self.email, "password": self.password})
+
+    async def register_new_account(self):
+        # A fresh email each time so /register is measured on its success
+        # path; the tenant keeps using its own account afterwards
+        self.signups += 1
+        email = f"loadtest-{os.getpid()}-{self.index}-{self.signups}@example.com"
+        response = await self.call("register", "POST", "/register", json={"email": email, "password": self.password})
+        if response is not None and response.status_code == 200:
+            await self.call("token", "POST", "/token", data={"username": email, "password": self.password})
+
+    async def token(self):
+        response = await self.call(
+            "token", "POST", "/token", data={"username": self.email, "password": self.password}
+        )
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def upload(self):
+        await self.call(
+            "upload-sales", "POST", "/upload-sales/",
+            files={"file": ("sales.csv", self.data, "text/csv")}, headers=self.headers,
+        )
+
+    async def available_options(self):
+        response = await self.call("available-options", "GET", "/available-options/", headers=self.headers)
+        if response is not None and response.status_code == 200 and not self.series:
+            options = response.json()
+            self.series = [(p, c) for p in options["products"] for c in options["cities"]]
+
+    async def forecast(self):
+        if not self.series:
+            await self.available_options()
+        if not self.series:
+            return
+        product, city = random.choice(self.series)
+        await self.call(
+            "forecast", "POST", "/forecast/",
+            params={"product": product, "city": city, "days": 30}, json={}, headers=self.headers,
+        )
+
+
+ACTIONS = {
+    "register": Tenant.register_new_account,
+    "token": Tenant.token,
+    "upload": Tenant.upload,
+    "available-options": Tenant.available_options,
+    "forecast": Tenant.forecast,
+}
+
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise SystemExit(f"Unknown endpoint in --mix: {name} (choose from {', '.join(ACTIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def drive(tenant: Tenant, mix: dict, deadline: float):
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        action = random.choices(names, weights)[0]
+        await ACTIONS[action](tenant)
+
+
+def report(stats: Stats, elapsed: float) -> dict:
+    summary = {"elapsed_seconds": elapsed, "endpoints": {}}
+    header = f"{'endpoint':<20}{'count':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'429/503':>9}"
+    print(header)
+    print("-" * len(header))
+    total = 0
+    for endpoint, latencies in sorted(stats.latencies.items()):
+        statuses = stats.statuses[endpoint]
+        rejected = statuses.get(429, 0) + statuses.get(503, 0)
+        row = {
+            "count": len(latencies),
+            "throughput_rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "error_rate": stats.errors[endpoint] / len(latencies),
+            "rejected": rejected,
+            "statuses": {str(k): v for k, v in statuses.items()},
+        }
+        summary["endpoints"][endpoint] = row
+        total += len(latencies)
+        print(
+            f"{endpoint:<20}{row['count']:>8}{row['throughput_rps']:>9.1f}{row['p50_ms']:>10.1f}"
+            f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['error_rate']:>8.1%}{rejected:>9}"
+        )
+
+    lag = stats.loop_lag
+    summary["throughput_rps"] = total / elapsed
+    summary["loop_lag_ms"] = {
+        "mean": statistics.fmean(lag) * 1000 if lag else 0.0,
+        "p99": percentile(lag, 0.99) * 1000,
+        "max": max(lag) * 1000 if lag else 0.0,
+    }
+    print("-" * len(header))
+    print(f"total throughput: {summary['throughput_rps']:.1f} req/s over {elapsed:.1f}s")
+    print(
+        f"event-loop lag: mean {summary['loop_lag_ms']['mean']:.1f} ms, "
+        f"p99 {summary['loop_lag_ms']['p99']:.1f} ms, max {summary['loop_lag_ms']['max']:.1f} ms"
+    )
+    return summary
+
+
+async def run(args):
+    stats = Stats()
+    mix = parse_mix(args.mix)
+    with open(args.data, "rb") as f:
+        data = f.read()
+
+    if args.url:
+        transport, base_url, startup, shutdown = None, args.url, None, None
+    else:
+        # In-process app on a throwaway SQLite file; must be configured before importing the app
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        os.environ["DATABASE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "loadtest.db")
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from app.main import app, startup, shutdown
+        transport, base_url = httpx.ASGITransport(app=app), "http://loadtest"
+
+    if startup:
+        await startup()
+    stop = asyncio.Event()
+    monitor = None
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout) as client:
+            # Setup phase: every tenant registers, logs in and uploads once
+            setup_stats = Stats()
+            tenants = [Tenant(client, setup_stats, i, data) for i in range(args.tenants)]
+            setup_started = time.monotonic()
+            for step in (Tenant.register, Tenant.token, Tenant.upload):
+                await asyncio.gather(*(step(t) for t in tenants))
+            setup_requests = sum(len(v) for v in setup_stats.latencies.values())
+            setup_errors = sum(setup_stats.errors.values())
+            print(f"Setup: {setup_requests} requests ({setup_errors} errors) in {time.monotonic() - setup_started:.1f}s")
+
+            # Measured phase: fresh stats, clock and lag monitor
+            for tenant in tenants:
+                tenant.stats = stats
+            monitor = asyncio.create_task(monitor_loop_lag(stats, args.lag_interval, stop))
+            print(f"Driving {args.tenants} tenants x {args.concurrency} workers for {args.duration}s (mix: {mix})")
+            started = time.monotonic()
+            deadline = started + args.duration
+            await asyncio.gather(*(
+                drive(tenant, mix, deadline) for tenant in tenants for _ in range(args.concurrency)
+            ))
+            elapsed = time.monotonic() - started
+    finally:
+        stop.set()
+        if monitor:
+            await monitor
+        if shutdown:
+            await shutdown()
+
+    summary = report(stats, elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Inventory Forecasting API")
+    parser.add_argument("--url", help="Target a running server instead of starting the app in-process")
+    parser.add_argument("--tenants", type=int, default=10, help="Number of simulated tenants")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent request loops per tenant")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to drive traffic for")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted traffic mix, e.g. forecast=1,upload=1")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="CSV uploaded by each tenant")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--lag-interval", type=float, default=0.05, help="Event-loop lag sampling interval")
+    parser.add_argument("--json", help="Also write the summary to this JSON file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
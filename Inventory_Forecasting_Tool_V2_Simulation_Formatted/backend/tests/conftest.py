@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Import the app against a throwaway SQLite file instead of PostgreSQL
+os.environ.setdefault("DATABASE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="inventory-tests-"), "test.db"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,180 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.admission import AdmissionController
+
+
+async def _settle():
+    # Let waiting coroutines run up to their next await
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_free_slot_is_granted_immediately():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=2, max_queue_depth=4, max_queued_per_tenant=2)
+        await controller.acquire(1)
+        await controller.acquire(2)
+        assert controller.active == 2
+        assert controller.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_freed_slots_are_handed_out_round_robin():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=10, max_queued_per_tenant=5)
+        await controller.acquire(0)
+
+        order = []
+
+        async def request(tenant, n):
+            await controller.acquire(tenant)
+            order.append((tenant, n))
+
+        # Tenant 1 queues three requests before tenant 2 queues two
+        tasks = [asyncio.create_task(request(1, n)) for n in range(3)]
+        await _settle()
+        tasks += [asyncio.create_task(request(2, n)) for n in range(2)]
+        await _settle()
+        assert controller.queued == 5
+
+        for _ in range(5):
+            controller.release()
+            await _settle()
+        await asyncio.gather(*tasks)
+
+        assert order == [(1, 0), (2, 0), (1, 1), (2, 1), (1, 2)]
+        # The last request still holds the one slot
+        assert controller.active == 1
+        assert controller.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_tenant_over_its_queue_limit_gets_429():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=10, max_queued_per_tenant=1)
+        await controller.acquire(1)
+        waiter = asyncio.create_task(controller.acquire(1))
+        await _settle()
+
+        with pytest.raises(HTTPException) as exc:
+            await controller.acquire(1)
+        assert exc.value.status_code == 429
+        assert "Retry-After" in exc.value.headers
+        assert controller.rejected_tenant_total == 1
+
+        # Another tenant can still queue
+        other = asyncio.create_task(controller.acquire(2))
+        await _settle()
+        assert controller.queued == 2
+
+        waiter.cancel()
+        other.cancel()
+        await asyncio.gather(waiter, other, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_gets_503():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=2, max_queued_per_tenant=5)
+        await controller.acquire(1)
+        waiters = [asyncio.create_task(controller.acquire(tenant)) for tenant in (2, 3)]
+        await _settle()
+
+        with pytest.raises(HTTPException) as exc:
+            await controller.acquire(4)
+        assert exc.value.status_code == 503
+        assert "Retry-After" in exc.value.headers
+        assert controller.rejected_full_total == 1
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=4, max_queued_per_tenant=4)
+        await controller.acquire(1)
+        waiter = asyncio.create_task(controller.acquire(2))
+        await _settle()
+        assert controller.queued == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert controller.queued == 0
+        assert not controller.waiters
+
+        controller.release()
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_handed_to_cancelled_waiter_is_passed_on():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=4, max_queued_per_tenant=4)
+        await controller.acquire(1)
+        first = asyncio.create_task(controller.acquire(2))
+        second = asyncio.create_task(controller.acquire(3))
+        await _settle()
+
+        # The slot is handed to the first waiter, which is cancelled before it runs
+        controller.release()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await _settle()
+
+        assert second.done() and second.exception() is None
+        assert controller.active == 1
+        assert controller.queued == 0
+
+        controller.release()
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_context_manager_releases_on_error():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=4, max_queued_per_tenant=4)
+        with pytest.raises(RuntimeError):
+            async with controller.slot(1):
+                raise RuntimeError("fit failed")
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_only_completed_fits_update_the_fit_time_average():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=4, max_queued_per_tenant=4)
+        async with controller.slot(1):
+            await asyncio.sleep(0.05)
+        completed = controller.avg_fit_seconds
+        assert completed >= 0.05
+
+        async def cancelled_fit():
+            async with controller.slot(1):
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(cancelled_fit())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        with pytest.raises(RuntimeError):
+            async with controller.slot(1):
+                raise RuntimeError("fit failed")
+
+        assert controller.avg_fit_seconds == completed
+        assert controller.active == 0
+
+    asyncio.run(scenario())
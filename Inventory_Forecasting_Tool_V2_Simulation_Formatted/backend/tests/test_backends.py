@@ -0,0 +1,94 @@
+import pandas as pd
+import pytest
+
+from app.backends import (
+    _interval_levels, drop_intervals, is_default_scenario, quantile_column, resample_sales, scenario_key,
+    seasonal_naive_forecast,
+)
+from app.forecast import SimulationParams
+
+
+def _rows(start, days, sales=1.0, copies=1):
+    dates = pd.date_range(start, periods=days, freq="D").repeat(copies)
+    return pd.DataFrame({"date": dates.date, "sales": sales})
+
+
+def test_daily_is_returned_unchanged():
+    df = _rows("2024-01-01", 10)
+    assert resample_sales(df, "daily") is df
+
+
+def test_weekly_totals_drop_partial_weeks():
+    # Wed 2024-01-03 .. Tue 2024-01-23: only the weeks ending 14 and 21 Jan are complete
+    weekly = resample_sales(_rows("2024-01-03", 21), "weekly")
+    assert weekly["date"].dt.date.astype(str).tolist() == ["2024-01-14", "2024-01-21"]
+    assert weekly["sales"].tolist() == [7.0, 7.0]
+
+
+def test_monthly_totals_drop_partial_months():
+    monthly = resample_sales(_rows("2024-01-15", 60), "monthly")
+    assert monthly["date"].dt.date.astype(str).tolist() == ["2024-02-01"]
+    assert monthly["sales"].tolist() == [29.0]
+
+
+def test_rows_sharing_a_date_are_averaged_before_summing():
+    # Four rows a day (e.g. one per store) averaging 10 give a daily value of 10
+    df = pd.concat([_rows("2024-01-01", 14, sales=s) for s in (4.0, 8.0, 12.0, 16.0)])
+    weekly = resample_sales(df, "weekly")
+    assert weekly["sales"].tolist() == pytest.approx([70.0, 70.0])
+
+
+def test_default_scenario_leaves_every_regressor_at_its_default():
+    assert is_default_scenario(None)
+    assert is_default_scenario(SimulationParams())
+    # Categories the model has no regressor for change nothing
+    assert is_default_scenario(SimulationParams(seasonality="monsoon", weather_condition="foggy"))
+
+
+def test_any_active_regressor_makes_a_scenario():
+    assert not is_default_scenario(SimulationParams(discount_pct=10))
+    assert not is_default_scenario(SimulationParams(is_holiday=1))
+    assert not is_default_scenario(SimulationParams(seasonality="Summer"))
+    assert not is_default_scenario(SimulationParams(weather_condition="rainy"))
+
+
+def test_scenario_key_is_default_for_baseline_inputs():
+    assert scenario_key(None) == "default"
+    assert scenario_key(SimulationParams(seasonality="monsoon")) == "default"
+
+
+def test_scenario_key_normalises_equivalent_inputs():
+    a = scenario_key(SimulationParams(discount_pct=10, seasonality="Summer"))
+    b = scenario_key(SimulationParams(discount_pct=10.0, seasonality="summer", is_holiday=None))
+    assert a == b
+    assert a != scenario_key(SimulationParams(discount_pct=20, seasonality="summer"))
+
+
+def test_interval_levels_per_uncertainty_mode():
+    assert _interval_levels("none") == {}
+    assert _interval_levels("reduced") == pytest.approx({"yhat_lower": 0.1, "yhat_upper": 0.9})
+    assert _interval_levels("full", [0.05, 0.95]) == pytest.approx(
+        {"yhat_lower": 0.1, "yhat_upper": 0.9, "yhat_q0.05": 0.05, "yhat_q0.95": 0.95}
+    )
+
+
+def test_quantile_columns_are_named_by_level():
+    assert quantile_column(0.05) == "yhat_q0.05"
+    assert quantile_column(0.5) == "yhat_q0.5"
+
+
+def test_forecast_columns_follow_the_uncertainty_mode():
+    df = _rows("2024-01-01", 42).assign(sales=[float(i % 7 + i % 3) for i in range(42)])
+
+    plain = seasonal_naive_forecast(df, 3, uncertainty="none")
+    assert set(plain[0]) == {"ds", "yhat"}
+
+    full = seasonal_naive_forecast(df, 3, uncertainty="full", quantiles=[0.05, 0.95])
+    assert set(full[0]) == {"ds", "yhat", "yhat_lower", "yhat_upper", "yhat_q0.05", "yhat_q0.95"}
+    for record in full:
+        assert record["yhat_q0.05"] <= record["yhat_lower"] <= record["yhat_upper"] <= record["yhat_q0.95"]
+
+
+def test_drop_intervals_keeps_only_the_point_forecast():
+    records = [{"ds": "2024-01-01", "yhat": 1.0, "yhat_lower": 0.5, "yhat_upper": 1.5, "yhat_q0.9": 1.4}]
+    assert drop_intervals(records) == [{"ds": "2024-01-01", "yhat": 1.0}]
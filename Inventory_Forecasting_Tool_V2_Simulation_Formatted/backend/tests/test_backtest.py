@@ -0,0 +1,29 @@
+import pandas as pd
+
+from app.backtest import rolling_cutoffs
+
+
+def _dates(start, end):
+    return pd.Series(pd.date_range(start, end, freq="D"))
+
+
+def _iso(cutoffs):
+    return [c.date().isoformat() for c in cutoffs]
+
+
+def test_cutoffs_step_back_from_the_last_full_horizon():
+    cutoffs = rolling_cutoffs(_dates("2024-01-01", "2024-12-31"), horizon=30, initial_days=180,
+                              period_days=60, max_folds=10)
+    # Last cutoff leaves 30 days of actuals; none leaves under 180 days of training
+    assert _iso(cutoffs) == ["2024-08-03", "2024-10-02", "2024-12-01"]
+
+
+def test_max_folds_keeps_the_most_recent_cutoffs():
+    cutoffs = rolling_cutoffs(_dates("2024-01-01", "2024-12-31"), horizon=30, initial_days=180,
+                              period_days=60, max_folds=2)
+    assert _iso(cutoffs) == ["2024-10-02", "2024-12-01"]
+
+
+def test_too_little_history_gives_no_cutoffs():
+    assert rolling_cutoffs(_dates("2024-01-01", "2024-03-31"), horizon=30, initial_days=90,
+                           period_days=30, max_folds=3) == []
@@ -0,0 +1,106 @@
+import asyncio
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+from app import forecast
+from app.admission import AdmissionController
+from app.forecast import SimulationParams, forecast_within_budget
+
+
+class FakeFit:
+    """Stands in for the worker-pool fit: waits `seconds`, then returns a flat forecast."""
+
+    def __init__(self, seconds=0.0, error=None):
+        self.seconds = seconds
+        self.error = error
+        self.calls = 0
+        self.finished = False
+
+    async def __call__(self, user_id, product, city, daily, days, *args):
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        if self.error:
+            raise self.error
+        self.finished = True
+        records = [{"ds": d, "yhat": 5.0, "yhat_lower": 4.0, "yhat_upper": 6.0}
+                   for d in pd.date_range("2024-03-01", periods=days)]
+        return records, "prophet"
+
+
+@pytest.fixture
+def budgeted(monkeypatch):
+    async def load_sales_frame(*args):
+        dates = pd.date_range("2024-01-01", periods=60, freq="D")
+        return pd.DataFrame({"date": dates.date, "sales": [float(d.dayofweek) for d in dates]})
+
+    controller = AdmissionController(max_concurrent=2, max_queue_depth=4, max_queued_per_tenant=2)
+    monkeypatch.setattr(forecast, "load_sales_frame", load_sales_frame)
+    monkeypatch.setattr(forecast, "admission", controller)
+
+    def run(fit, budget_ms=500, params=None):
+        monkeypatch.setattr(forecast, "fit_forecast", fit)
+
+        async def scenario():
+            return await forecast_within_budget(
+                1, "Toys", "Delhi", 7, params or SimulationParams(), "daily", None, budget_ms, refine=False,
+            )
+        return asyncio.run(scenario())
+
+    run.controller = controller
+    return run
+
+
+def test_fit_within_budget_is_served_in_full(budgeted):
+    response = budgeted(FakeFit())
+    assert response["tier"] == "full"
+    assert response["scenario_applied"] is True
+    assert len(response["forecast"]) == 7
+
+
+def test_expected_fit_time_over_budget_skips_the_fit(budgeted):
+    budgeted.controller.avg_fit_seconds = 10.0
+    fit = FakeFit()
+    response = budgeted(fit)
+    assert fit.calls == 0
+    assert response["tier"] == "approximate"
+    assert response["scenario_applied"] is True
+    assert len(response["forecast"]) == 7
+
+
+def test_approximate_answer_to_a_scenario_is_flagged(budgeted):
+    budgeted.controller.avg_fit_seconds = 10.0
+    response = budgeted(FakeFit(), params=SimulationParams(discount_pct=20))
+    assert response["tier"] == "approximate"
+    assert response["scenario_applied"] is False
+
+
+def test_fit_that_misses_the_budget_is_left_running(budgeted, monkeypatch):
+    fit = FakeFit(seconds=0.3)
+    monkeypatch.setattr(forecast, "fit_forecast", fit)
+
+    async def scenario():
+        response = await forecast_within_budget(
+            1, "Toys", "Delhi", 7, SimulationParams(), "daily", None, 100, refine=False,
+        )
+        assert not fit.finished
+        await asyncio.sleep(0.4)
+        return response
+
+    response = asyncio.run(scenario())
+    assert response["tier"] == "approximate"
+    # Not cancelled: the fit ran to completion after the answer was sent
+    assert fit.finished
+
+
+def test_full_fit_queue_falls_back_to_the_approximation(budgeted):
+    busy = HTTPException(status_code=429, detail="Too many queued", headers={"Retry-After": "1"})
+    response = budgeted(FakeFit(error=busy))
+    assert response["tier"] == "approximate"
+
+
+def test_other_fit_errors_are_raised(budgeted):
+    with pytest.raises(HTTPException) as exc:
+        budgeted(FakeFit(error=HTTPException(status_code=400, detail="Not enough history")))
+    assert exc.value.status_code == 400
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from app.inventory import INTERVAL_Z, compute_reorder_policy
+
+
+def _policy(yhat, spread, lead_time, service_level=0.95, stock=0.0):
+    yhat = np.array(yhat, dtype=float)
+    half = np.where(np.isnan(yhat), np.nan, spread * INTERVAL_Z)
+    n = yhat.shape[0]
+    return compute_reorder_policy(
+        yhat, yhat - half, yhat + half,
+        np.full(n, lead_time), np.full(n, service_level), np.full(n, stock),
+    )
+
+
+def test_lead_time_demand_sums_the_forecast():
+    policy = _policy([[10.0] * 14], spread=0.0, lead_time=7)
+    assert policy["lead_time_demand"][0] == pytest.approx(70.0)
+    assert policy["safety_stock"][0] == pytest.approx(0.0)
+    assert not policy["horizon_short"][0]
+
+
+def test_safety_stock_from_independent_daily_errors():
+    # Daily sigma 2 over 4 days -> lead-time sigma 4; z(0.5) = 0
+    policy = _policy([[5.0] * 10], spread=2.0, lead_time=4, service_level=0.5)
+    assert policy["safety_stock"][0] == pytest.approx(0.0)
+
+    policy = _policy([[5.0] * 10], spread=2.0, lead_time=4, service_level=0.8413447)
+    assert policy["safety_stock"][0] == pytest.approx(4.0, rel=1e-4)
+
+
+def test_short_forecast_uses_its_own_length():
+    # A 7-day forecast padded next to a 14-day one
+    nan = [np.nan] * 7
+    policy = _policy([[10.0] * 7 + nan, [1.0] * 14], spread=1.0, lead_time=14)
+
+    assert policy["lead_time_demand"][0] == pytest.approx(140.0)
+    assert policy["horizon_short"][0]
+    assert policy["safety_stock"][0] > 0
+    assert policy["lead_time_demand"][1] == pytest.approx(14.0)
+    assert not policy["horizon_short"][1]
+
+
+def test_reorder_quantity_never_negative():
+    policy = _policy([[10.0] * 7, [10.0] * 7], spread=0.0, lead_time=7, stock=0.0)
+    assert policy["reorder_quantity"].tolist() == pytest.approx([70.0, 70.0])
+
+    policy = _policy([[10.0] * 7], spread=0.0, lead_time=7, stock=500.0)
+    assert policy["reorder_quantity"][0] == 0.0
@@ -0,0 +1,22 @@
+from datetime import date
+
+import pytest
+
+from app.utils import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("Toys", "Delhi", date(2023, 5, 17), 4242)
+    assert decode_cursor(cursor) == ("Toys", "Delhi", date(2023, 5, 17), 4242)
+
+
+def test_cursor_is_url_safe_for_any_text():
+    cursor = encode_cursor("Home & Garden/Outdoor?", "São Paulo", date(2024, 1, 1), 1)
+    assert all(ch.isalnum() or ch in "-_=" for ch in cursor)
+    assert decode_cursor(cursor)[:2] == ("Home & Garden/Outdoor?", "São Paulo")
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor("a", "b", date(2024, 1, 1), 1)[:-4], "WzEsMl0="])
+def test_bad_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
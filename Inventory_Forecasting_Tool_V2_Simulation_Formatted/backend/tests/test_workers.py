@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.workers import MB, _run_task
+
+pytestmark = pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc")
+
+
+def _spawn_allocating_child(megabytes):
+    # Stands in for the Stan binary: a child process holding memory for a while
+    code = f"import time; block = b'x' * ({megabytes} * 1024 * 1024); time.sleep(0.5)"
+    subprocess.run([sys.executable, "-c", code], check=True)
+    return "fitted"
+
+
+def test_task_stats_report_child_process_memory():
+    result, stats = _run_task(_spawn_allocating_child, (200,))
+    assert result == "fitted"
+    assert stats["stan_peak_rss_bytes"] >= 150 * MB
+    assert stats["peak_rss_bytes"] > 0
+